@@ -28,9 +28,17 @@ else:
 logger.info(f"Working directory: {os.getcwd()}")
 logger.info(f"Bundle directory: {bundle_dir}")
 
+# Vendor Bootstrap/Font Awesome/Plotly into static/ on first run so the app
+# works offline; main reads the manifest on import, so this must come first.
+try:
+    import build_assets
+    build_assets.ensure_built()
+except Exception as e:
+    logger.warning(f"Could not vendor front-end assets, using CDNs: {e}")
+
 # Now import after setting up the directory
 try:
-    from main import init_db, app
+    from main import init_db, start_recurring_scheduler, start_backup_scheduler, app
     logger.info("Successfully imported main module")
 except Exception as e:
     logger.error(f"Failed to import main: {e}")
@@ -64,6 +72,10 @@ def main():
         init_db()
         print("✅ Database initialized")
         logger.info("Database initialized successfully")
+
+        # Keep materialising recurring transactions and taking backups while the app runs
+        start_recurring_scheduler()
+        start_backup_scheduler()
         
         # Find available port
         port = find_free_port()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for the accounting app.
+
+    python benchmark.py rules [--rows 1000000] [--rules 200]
+    python benchmark.py money [--rows 5000000]
+    python benchmark.py load [--clients 8] [--requests 200] [--dir PATH] [--url http://127.0.0.1:5000 --book-id 1]
+
+Nothing here touches accounting.db: data is generated in memory, and the
+in-process load test runs each mode against a fresh database in a temporary
+directory. With --url the load test posts to a running server instead (which
+writes to that server's database).
+"""
+
+import argparse
+import http.cookiejar
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+import main
+from main import CategoryMatcher, format_amount, to_cents
+
+WORDS = ['coffee', 'grocery', 'market', 'taxi', 'metro', 'rent', 'power', 'water', 'cinema',
+         'pharmacy', 'gym', 'book', 'lunch', 'dinner', 'fuel', 'parking', 'internet', 'phone']
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f'  {label:<40} {time.perf_counter() - start:8.3f}s')
+    return result
+
+
+def bench_rules(rows, n_rules, seed=1):
+    """Compare the merged-regex matcher with testing every rule's regex in turn."""
+    rng = random.Random(seed)
+    keywords = [f'{w}{i}' for i, w in zip(range(n_rules), WORDS * (n_rules // len(WORDS) + 1))]
+    rules = [{'pattern': k, 'category': f'Cat{i % 7}',
+              'min_cents': None if i % 3 else 500, 'max_cents': None if i % 5 else 50000}
+             for i, k in enumerate(keywords)]
+    descriptions = [f'{rng.choice(WORDS)} {rng.choice(keywords) if rng.random() < 0.7 else "misc"} #{i}'
+                    for i in range(rows)]
+    df = pd.DataFrame({'description': descriptions, 'amount_cents': [rng.randint(100, 100000) for _ in range(rows)]})
+    print(f'rules: {rows:,} descriptions, {n_rules} rules')
+
+    matcher = timed('compile merged matcher', lambda: CategoryMatcher(rules))
+    matched = timed('vectorised match_frame (all rows)', lambda: matcher.match_frame(df))
+    print(f'  matched {len(matched):,} rows ({len(matched) / rows:.1%})')
+
+    # per-transaction path used by rapid entry, and the naive N-regex loop, on a sample
+    sample = df.head(min(rows, 100_000))
+    timed(f'match() per row ({len(sample):,} rows)',
+          lambda: [matcher.match(d, a) for d, a in zip(sample['description'], sample['amount_cents'])])
+    compiled = [(re.compile(re.escape(r['pattern']), re.IGNORECASE), r) for r in rules]
+
+    def naive(description, amount):
+        for regex, r in compiled:
+            if (regex.search(description) and (r['min_cents'] is None or amount >= r['min_cents'])
+                    and (r['max_cents'] is None or amount <= r['max_cents'])):
+                return r['category']
+        return None
+
+    naive_result = timed(f'sequential regex per rule ({len(sample):,} rows)',
+                         lambda: [naive(d, a) for d, a in zip(sample['description'], sample['amount_cents'])])
+    merged_result = [matched.get(i) for i in sample.index]
+    mismatches = sum(a != b for a, b in zip(naive_result, merged_result))
+    print(f'  results differing from sequential regex: {mismatches}')
+
+
+def bench_money(rows, seed=1):
+    """Check that integer-cents aggregation is exact and compare it with REAL sums.
+
+    Random two-decimal amounts are parsed with to_cents, summed in SQLite and in
+    NumPy int64, and compared against an exact Decimal sum of the original
+    strings. Returns False if any integer path differs from the exact total.
+    """
+    rng = np.random.default_rng(seed)
+    cents = rng.integers(-500_000, 5_000_000, size=rows)
+    texts = [format_amount(c) for c in cents.tolist()]
+    print(f'money: {rows:,} random amounts')
+
+    parsed = timed('parse with to_cents', lambda: np.array([to_cents(t) for t in texts], dtype=np.int64))
+    exact = timed('exact Decimal sum', lambda: sum(Decimal(t) for t in texts))
+    numpy_sum = timed('NumPy int64 sum', lambda: int(parsed.sum()))
+
+    con = sqlite3.connect(':memory:')
+    con.execute('CREATE TABLE t (amount_cents INTEGER, amount REAL)')
+    con.executemany('INSERT INTO t VALUES (?, ?)', zip(parsed.tolist(), (float(t) for t in texts)))
+    sql_cents = timed('SQLite SUM(amount_cents)', lambda: con.execute('SELECT SUM(amount_cents) FROM t').fetchone()[0])
+    sql_real = timed('SQLite SUM(amount REAL)', lambda: con.execute('SELECT SUM(amount) FROM t').fetchone()[0])
+
+    ok = parsed.tolist() == cents.tolist() and Decimal(numpy_sum) / 100 == exact and Decimal(sql_cents) / 100 == exact
+    print(f'  exact total                 {exact}')
+    print(f'  integer cents (SQL / NumPy) {format_amount(sql_cents)} / {format_amount(numpy_sum)}')
+    print(f'  REAL sum                    {sql_real!r} (off by {Decimal(sql_real) - exact:.2E})')
+    print('  integer paths exact:', 'yes' if ok else 'NO')
+    return ok
+
+
+def run_clients(clients, requests, make_client):
+    """Run `clients` threads that each send `requests` requests as fast as they can.
+
+    make_client(i) sets up client i and returns a function send(n) that makes
+    request n and returns True on success. Returns (elapsed seconds, sorted
+    latencies in ms, failures).
+    """
+    senders = [make_client(i) for i in range(clients)]
+    latencies, failures = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def client(send):
+        mine, failed = [], 0
+        barrier.wait()
+        for n in range(requests):
+            start = time.perf_counter()
+            try:
+                ok = send(n)
+            except Exception:
+                ok = False
+            mine.append((time.perf_counter() - start) * 1000)
+            failed += not ok
+        with lock:
+            latencies.extend(mine)
+            failures.append(failed)
+
+    threads = [threading.Thread(target=client, args=(send,)) for send in senders]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, sorted(latencies), sum(failures)
+
+
+def report_load(label, elapsed, latencies, failures):
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+    print(f'  {label:<14} {len(latencies) / elapsed:8.0f} req/s   p50 {pct(0.50):7.2f} ms   '
+          f'p95 {pct(0.95):7.2f} ms   p99 {pct(0.99):7.2f} ms   max {latencies[-1]:7.2f} ms   errors {failures}')
+
+
+def add_form(i, n):
+    return {'amount': f'{n % 50 + 1}.25', 'category': 'Food', 'description': f'load client {i} #{n}'}
+
+
+def bench_load(clients, requests, directory=None):
+    """Compare per-request commits with the group-commit writer for concurrent /add posts.
+
+    Every mode gets a fresh database with one book and a Food budget (so the
+    budget check runs on each insert), then `clients` threads post to /add
+    through their own app.test_client(). The row count afterwards must equal
+    the number of successful requests. The databases live in a temporary
+    directory under `directory`; put it on the disk you care about, since the
+    gain from group commit is mostly fsyncs saved.
+    """
+    print(f'load: {clients} clients x {requests} POST /add (in-process)')
+    cwd = os.getcwd()
+    ok = True
+    for label, group_commit in [('per-request', False), ('group commit', True)]:
+        with tempfile.TemporaryDirectory(dir=directory) as tmp:
+            os.chdir(tmp)
+            try:
+                main.GROUP_COMMIT = group_commit
+                main.init_db()
+                setup = main.app.test_client()
+                setup.post('/books', data={'name': 'Load'})
+                setup.post('/select_book', data={'book_id': 1})
+                setup.post('/budgets', data={'category': 'Food', 'monthly_limit': '1000000'})
+
+                def make_client(i):
+                    client = main.app.test_client()
+                    client.post('/select_book', data={'book_id': 1})
+
+                    def send(n):
+                        ok = client.post('/add', data=add_form(i, n)).status_code == 302
+                        # a browser would show the flash on the redirected page; drop it so
+                        # the session cookie does not grow with every request
+                        with client.session_transaction() as sess:
+                            sess.pop('_flashes', None)
+                        return ok
+                    return send
+
+                elapsed, latencies, failures = run_clients(clients, requests, make_client)
+                report_load(label, elapsed, latencies, failures)
+                with sqlite3.connect(main.DATABASE) as con:
+                    rows = con.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+                if rows != clients * requests - failures:
+                    print(f'  row count mismatch: {rows} rows for {clients * requests - failures} successful requests')
+                    ok = False
+            finally:
+                os.chdir(cwd)
+    return ok
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def bench_load_url(url, book_id, clients, requests):
+    """Post to /add on a running server; its own --group-commit setting decides the mode."""
+    print(f'load: {clients} clients x {requests} POST /add against {url}')
+
+    def make_client(i):
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect)
+
+        def post(path, data):
+            try:
+                opener.open(url + path, urllib.parse.urlencode(data).encode())
+            except urllib.error.HTTPError as e:
+                return e.code
+            return 200
+
+        post('/select_book', {'book_id': book_id})
+        return lambda n: post('/add', add_form(i, n)) == 302
+
+    report_load('server', *run_clients(clients, requests, make_client))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    rules_cmd = commands.add_parser('rules', help='auto-categorisation matcher throughput')
+    rules_cmd.add_argument('--rows', type=int, default=1_000_000)
+    rules_cmd.add_argument('--rules', type=int, default=200)
+    money_cmd = commands.add_parser('money', help='integer-cents aggregation exactness and speed')
+    money_cmd.add_argument('--rows', type=int, default=5_000_000)
+    load_cmd = commands.add_parser('load', help='concurrent rapid-entry clients, with and without group commit')
+    load_cmd.add_argument('--clients', type=int, default=8)
+    load_cmd.add_argument('--requests', type=int, default=200, help='requests per client')
+    load_cmd.add_argument('--dir', help='where to create the in-process test databases (default: system temp dir)')
+    load_cmd.add_argument('--url', help='base URL of a running server instead of the in-process app')
+    load_cmd.add_argument('--book-id', type=int, default=1, help='book to add to on the server (with --url)')
+    args = parser.parse_args()
+
+    if args.command == 'rules':
+        bench_rules(args.rows, args.rules)
+    elif args.command == 'money':
+        sys.exit(0 if bench_money(args.rows) else 1)
+    elif args.url:
+        bench_load_url(args.url.rstrip('/'), args.book_id, args.clients, args.requests)
+    else:
+        sys.exit(0 if bench_load(args.clients, args.requests, args.dir) else 1)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Vendor the app's front-end assets into static/vendor/.
+
+Downloads pinned releases of Bootstrap, Font Awesome and a partial Plotly
+bundle, renames every file with a content hash (e.g. bootstrap.min.1a2b3c4d.css)
+so it can be cached forever, writes precompressed .gz (and .br when the optional
+`brotli` package is installed) variants next to it, and records the mapping in
+static/vendor/manifest.json. Run it again after changing a pinned version:
+
+    python build_assets.py
+
+main.py and app_launcher.py call ensure_built() on start, so a fresh checkout
+vendors the assets on its first run (when the network is available).
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import urllib.request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip variants are always written
+    brotli = None
+
+VENDOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'vendor')
+MANIFEST = os.path.join(VENDOR_DIR, 'manifest.json')
+
+BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist'
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0'
+
+# logical name -> pinned source URL. plotly-basic is the smallest official
+# partial bundle containing the pie trace (scatter, bar, pie) — about a third
+# of the full plotly.min.js.
+ASSETS = {
+    'bootstrap.min.css': f'{BOOTSTRAP}/css/bootstrap.min.css',
+    'bootstrap.bundle.min.js': f'{BOOTSTRAP}/js/bootstrap.bundle.min.js',
+    'fontawesome.min.css': f'{FONT_AWESOME}/css/all.min.css',
+    'plotly-basic.min.js': 'https://cdn.plot.ly/plotly-basic-2.26.0.min.js',
+}
+
+# already-compressed formats gain nothing from gzip/brotli
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ttf')
+
+FONT_URL = re.compile(r'url\(\.\./webfonts/([^)?#]+)\)')
+
+
+def fetch(url):
+    print(f'  fetching {url}')
+    with urllib.request.urlopen(url, timeout=30) as resp:
+        return resp.read()
+
+
+def fingerprint(name, data):
+    """Return `name` with the first 8 hex digits of the content hash inserted before the extension."""
+    digest = hashlib.sha256(data).hexdigest()[:8]
+    base, _, suffix = name.rpartition('.')
+    return f'{base}.{digest}.{suffix}'
+
+
+def write_asset(name, data):
+    """Write the fingerprinted asset and its precompressed variants, return the hashed name."""
+    hashed = fingerprint(name, data)
+    path = os.path.join(VENDOR_DIR, hashed)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if hashed.endswith(COMPRESSIBLE):
+        # mtime=0 keeps the .gz byte-identical across builds
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+    return hashed
+
+
+def build():
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    manifest = {}
+    for name, url in ASSETS.items():
+        data = fetch(url)
+        if name == 'fontawesome.min.css':
+            # vendor the webfonts too and point the CSS at their hashed names
+            text = data.decode('utf-8')
+            fonts = {}
+            for font in sorted(set(FONT_URL.findall(text))):
+                fonts[font] = write_asset(font, fetch(f'{FONT_AWESOME}/webfonts/{font}'))
+                manifest[font] = fonts[font]
+            data = FONT_URL.sub(lambda m: f'url({fonts[m.group(1)]})', text).encode('utf-8')
+        manifest[name] = write_asset(name, data)
+
+    # drop files from previous builds that the new manifest no longer references
+    keep = set(manifest.values())
+    for filename in os.listdir(VENDOR_DIR):
+        original = filename[:-3] if filename.endswith(('.gz', '.br')) else filename
+        if filename != 'manifest.json' and original not in keep:
+            os.remove(os.path.join(VENDOR_DIR, filename))
+
+    with open(MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f'Wrote {len(manifest)} assets to {VENDOR_DIR}' + ('' if brotli else ' (install brotli for .br variants)'))
+
+
+def ensure_built():
+    """Build the assets unless every one is already in the manifest; return True if they are.
+
+    A failed build (e.g. no network) is not fatal: pages then load the assets
+    from their CDNs, as asset_url() falls back to them.
+    """
+    try:
+        with open(MANIFEST) as f:
+            if set(ASSETS) <= set(json.load(f)):
+                return True
+    except (OSError, ValueError):
+        pass
+    try:
+        build()
+    except OSError as e:
+        print(f'Could not vendor front-end assets ({e}); pages will load them from CDNs')
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    try:
+        build()
+    except OSError as e:
+        print(f'Failed to build assets: {e}')
+        sys.exit(1)
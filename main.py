@@ -1,27 +1,99 @@
 # write a webapp to display accounting data
 # functions include: adding transactions and sort them out, viewing charts
-from flask import Flask, render_template, request, redirect, url_for, flash, session, make_response, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, session, make_response, send_file, jsonify
 import sqlite3 as sqlite
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import calendar
+import threading
+import logging
 import plotly.graph_objects as go
 import plotly.utils
 import json
 import io
+import hashlib
+import mimetypes
+import re
 import tempfile
 import os
+import gzip
+import shutil
+import sys
+import argparse
+import base64
+import queue
+import time
+from collections import OrderedDict
+# concurrent.futures.TimeoutError is only an alias of the builtin from Python 3.11
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import closing, contextmanager
+import matplotlib
+matplotlib.use('Agg')  # charts are rendered server-side only, never in a window
+from matplotlib.figure import Figure
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.pdfbase import pdfutils
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase import pdfmetrics
+from werkzeug.utils import safe_join
+import build_assets
 
-app = Flask(__name__)
+# static files are served by serve_static() below so precompressed variants
+# and immutable cache headers can be used for fingerprinted assets
+app = Flask(__name__, static_folder=None)
+logger = logging.getLogger(__name__)
 DATABASE = 'accounting.db'
+# Optional sharded storage: when set (here, with ACCOUNTING_SHARD_DIR or with
+# --shard-dir), every book's transactions live in their own SQLite file in
+# this directory and DATABASE keeps only the catalog (books, categories,
+# budgets, rules). Leave unset for the classic single-file layout.
+SHARD_DIR = os.environ.get('ACCOUNTING_SHARD_DIR') or None
+# book files kept open in the connection LRU
+SHARD_POOL_SIZE = 16
+# SQLite's default SQLITE_MAX_ATTACHED; cross-book queries attach this many books at a time
+SHARD_ATTACH_LIMIT = 10
+# Group commit: when on (ACCOUNTING_GROUP_COMMIT=1 or --group-commit), new
+# transactions from /add are written by a single writer thread that commits
+# everything arriving within GROUP_COMMIT_WINDOW seconds in one transaction,
+# instead of one commit (and fsync) per request.
+GROUP_COMMIT = os.environ.get('ACCOUNTING_GROUP_COMMIT') == '1'
+GROUP_COMMIT_WINDOW = 0.005
+GROUP_COMMIT_MAX_BATCH = 256
 DEFAULT_DESCRIPTION = 'No description provided'
+# how often (seconds) the background scheduler materialises due recurring transactions
+RECURRING_INTERVAL = 3600
+RECURRING_FREQUENCIES = ['daily', 'weekly', 'monthly']
+# rules with an occurrence due by `today`; once next_date passes end_date a rule
+# is finished and is no longer selected (and rewritten) by every scheduler run
+RECURRING_DUE = 'next_date <= ? AND (end_date IS NULL OR next_date <= end_date)'
+# bumped whenever init_db changes the schema; stored in PRAGMA user_version and
+# checked before a backup is restored
+SCHEMA_VERSION = 2
+BACKUP_DIR = 'backups'
+# number of backups kept by rotation and how often (seconds) scheduled backups run
+BACKUP_RETENTION = 10
+BACKUP_INTERVAL = 24 * 3600
+# pages copied per backup step; writers can take the lock between steps
+BACKUP_PAGES = 256
+# rendered chart images, named by book, data version, chart type and size
+CHART_DIR = 'chart_cache'
+CHART_TYPES = ['pie', 'trend']
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+# width x height in pixels at CHART_DPI; the PDF export uses 'medium'
+CHART_SIZES = {'small': (480, 320), 'medium': (800, 500), 'large': (1200, 750)}
+CHART_DPI = 100
+# seconds a request waits for the chart renderer before giving up
+CHART_TIMEOUT = 30
+STATIC_DIR = os.path.join(app.root_path, 'static')
+# build_assets.py writes this mapping of asset name -> content-hashed filename
+ASSET_MANIFEST = os.path.join(STATIC_DIR, 'vendor', 'manifest.json')
+mimetypes.add_type('font/woff2', '.woff2')
+# used when the assets have not been vendored yet: the pinned CDN URLs they are built from
+ASSET_FALLBACK_URLS = build_assets.ASSETS
 # small secret key for flashing messages in this local app
 app.secret_key = 'change-this-to-a-secure-random-value'
 
@@ -35,7 +107,140 @@ SEED_CATEGORIES = [
     'Health',
     'Other'
 ]
+
+# Currencies a book can be kept in, with their display symbols. Money is stored
+# as integer minor units (cents); every currency listed has two decimal places.
+CURRENCIES = {
+    'USD': '$',
+    'EUR': '€',
+    'GBP': '£',
+    'CNY': '¥',
+    'HKD': 'HK$',
+    'CAD': 'CA$',
+    'AUD': 'A$',
+}
+DEFAULT_CURRENCY = 'USD'
+# Largest accepted amount, in cents (1,000,000,000.00). SQLite stores and sums
+# cents as signed 64-bit integers; this bound keeps any single value well inside
+# that range and leaves room for ~92 million maximal rows in one SUM.
+MAX_AMOUNT_CENTS = 10 ** 11
+
+# REAL money columns from schema version 1 and the integer cents columns replacing them
+CENTS_COLUMNS = [
+    ('transactions', 'amount', 'amount_cents INTEGER NOT NULL DEFAULT 0'),
+    ('budgets', 'monthly_limit', 'limit_cents INTEGER NOT NULL'),
+    ('recurring_rules', 'amount', 'amount_cents INTEGER NOT NULL'),
+    ('category_rules', 'min_amount', 'min_cents INTEGER'),
+    ('category_rules', 'max_amount', 'max_cents INTEGER'),
+]
+
+# Triggers that keep month_totals in step with transactions so budget checks
+# read a single running total instead of re-summing the month on every insert.
+MONTH_TOTALS_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS month_totals_insert AFTER INSERT ON transactions
+       BEGIN
+           INSERT INTO month_totals (book_id, category, month, total_cents)
+           VALUES (COALESCE(NEW.book_id, 0), COALESCE(NEW.category, ''), substr(NEW.date, 1, 7), NEW.amount_cents)
+           ON CONFLICT (book_id, category, month) DO UPDATE SET total_cents = total_cents + excluded.total_cents;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS month_totals_delete AFTER DELETE ON transactions
+       BEGIN
+           UPDATE month_totals SET total_cents = total_cents - OLD.amount_cents
+           WHERE book_id = COALESCE(OLD.book_id, 0) AND category = COALESCE(OLD.category, '')
+             AND month = substr(OLD.date, 1, 7);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS month_totals_update AFTER UPDATE OF amount_cents, category, book_id, date ON transactions
+       BEGIN
+           UPDATE month_totals SET total_cents = total_cents - OLD.amount_cents
+           WHERE book_id = COALESCE(OLD.book_id, 0) AND category = COALESCE(OLD.category, '')
+             AND month = substr(OLD.date, 1, 7);
+           INSERT INTO month_totals (book_id, category, month, total_cents)
+           VALUES (COALESCE(NEW.book_id, 0), COALESCE(NEW.category, ''), substr(NEW.date, 1, 7), NEW.amount_cents)
+           ON CONFLICT (book_id, category, month) DO UPDATE SET total_cents = total_cents + excluded.total_cents;
+       END''',
+]
+
+# Triggers that bump a per-scope version counter whenever data a cached page
+# depends on changes. 'book:<id>' covers a book's transactions and budgets;
+# 'catalog' covers the book and category lists shown on every page; 'rules'
+# tells the cached category matcher when to recompile.
+DATA_VERSION_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS data_version_{table}_{event.lower()} AFTER {event} ON {table}
+        BEGIN
+            INSERT INTO data_versions (scope, version) VALUES ({scope}, 1)
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1;{extra}
+        END'''
+    for table, event, scope, extra in [
+        ('transactions', 'INSERT', "'book:' || NEW.book_id", ''),
+        ('transactions', 'DELETE', "'book:' || OLD.book_id", ''),
+        ('transactions', 'UPDATE', "'book:' || NEW.book_id",
+         """
+            INSERT INTO data_versions (scope, version) SELECT 'book:' || OLD.book_id, 1
+            WHERE OLD.book_id IS NOT NEW.book_id
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1;"""),
+        ('budgets', 'INSERT', "'book:' || NEW.book_id", ''),
+        ('budgets', 'DELETE', "'book:' || OLD.book_id", ''),
+        ('budgets', 'UPDATE', "'book:' || NEW.book_id", ''),
+        ('books', 'INSERT', "'catalog'", ''),
+        ('books', 'DELETE', "'catalog'", ''),
+        ('books', 'UPDATE', "'catalog'", ''),
+        ('categories', 'INSERT', "'catalog'", ''),
+        ('categories', 'DELETE', "'catalog'", ''),
+        ('categories', 'UPDATE', "'catalog'", ''),
+        ('category_rules', 'INSERT', "'rules'", ''),
+        ('category_rules', 'DELETE', "'rules'", ''),
+        ('category_rules', 'UPDATE', "'rules'", ''),
+    ]
+]
+
+
+# UPSERT (INSERT ... ON CONFLICT DO UPDATE), used throughout, needs SQLite 3.24
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+
+def convert_to_cents(cur, table):
+    """Rebuild a schema version 1 table with its REAL money columns as integer cents.
+
+    Uses SQLite's create-copy-drop-rename recipe instead of ALTER TABLE DROP
+    COLUMN, which needs SQLite 3.35. The new table is the old CREATE statement
+    with each money column renamed and retyped, so other columns and
+    constraints are kept. Indexes and AUTOINCREMENT counters are carried over;
+    triggers are dropped and recreated by init_db.
+    """
+    definitions = {old: new for t, old, new in CENTS_COLUMNS if t == table}
+    renamed = {old: new.split()[0] for old, new in definitions.items()}
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    sql = cur.fetchone()[0]
+    for old, new in definitions.items():
+        # the old column's type and any NOT NULL / DEFAULT are replaced by the new definition
+        sql = re.sub(rf'\b{old}\s+\w+(\s+NOT\s+NULL)?(\s+DEFAULT\s+[^,\s)]+)?', new, sql, count=1, flags=re.I)
+    sql = re.sub(rf'^CREATE TABLE\s+["`\[]?{table}["`\]]?', f'CREATE TABLE {table}_cents', sql)
+    cur.execute(f'PRAGMA table_info({table})')
+    columns = [r[1] for r in cur.fetchall()]
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))
+    indexes = [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,))
+    for (trigger,) in cur.fetchall():
+        cur.execute(f'DROP TRIGGER {trigger}')
+    cur.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+    seq = cur.fetchone()
+    cur.execute(sql)
+    targets = ', '.join(renamed.get(c, c) for c in columns)
+    values = ', '.join((f'CAST(ROUND(COALESCE({c}, 0) * 100) AS INTEGER)' if 'NOT NULL' in definitions[c]
+                        else f'CAST(ROUND({c} * 100) AS INTEGER)') if c in renamed else c for c in columns)
+    cur.execute(f'INSERT INTO {table}_cents ({targets}) SELECT {values} FROM {table}')
+    cur.execute(f'DROP TABLE {table}')
+    cur.execute(f'ALTER TABLE {table}_cents RENAME TO {table}')
+    for index in indexes:
+        cur.execute(index)
+    if seq:
+        cur.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (seq[0], table))
+
+
 def init_db():
+    if sqlite.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(f'SQLite {sqlite.sqlite_version} is too old; this app needs SQLite '
+                           f'{".".join(map(str, MIN_SQLITE_VERSION))} or newer')
     with sqlite.connect(DATABASE) as con:
         cur = con.cursor()
         # Ensure transactions table exists
@@ -43,7 +248,7 @@ def init_db():
                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
                         date TEXT,
                         description TEXT,
-                        amount REAL,
+                        amount_cents INTEGER NOT NULL DEFAULT 0,
                         category TEXT)''')
         # If transactions table exists but lacks book_id, add the column.
         cur.execute("PRAGMA table_info(transactions)")
@@ -63,7 +268,11 @@ def init_db():
         # Users must create a book first before adding transactions.
         cur.execute('''CREATE TABLE IF NOT EXISTS books
                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT UNIQUE)''')
+                        name TEXT UNIQUE,
+                        currency TEXT NOT NULL DEFAULT 'USD')''')
+        cur.execute("PRAGMA table_info(books)")
+        if 'currency' not in [r[1] for r in cur.fetchall()]:
+            cur.execute("ALTER TABLE books ADD COLUMN currency TEXT NOT NULL DEFAULT 'USD'")
         # If there are existing transactions but no books (legacy data), create an
         # 'Imported' book and assign orphaned transactions to it so data isn't lost.
         cur.execute('SELECT COUNT(*) FROM books')
@@ -75,7 +284,562 @@ def init_db():
             imported_id = cur.lastrowid
             # Assign any transactions with NULL or invalid book_id to the imported book
             cur.execute('UPDATE transactions SET book_id = ? WHERE book_id IS NULL OR book_id NOT IN (SELECT id FROM books)', (imported_id,))
+        # budgets table stores a monthly spending limit per book and category;
+        # alert_threshold is the fraction of the limit that triggers a warning.
+        cur.execute('''CREATE TABLE IF NOT EXISTS budgets
+                       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        book_id INTEGER NOT NULL,
+                        category TEXT NOT NULL,
+                        limit_cents INTEGER NOT NULL,
+                        alert_threshold REAL NOT NULL DEFAULT 0.8,
+                        UNIQUE (book_id, category))''')
+        # recurring_rules describes repeating transactions (rent, subscriptions).
+        # next_date is the first occurrence not yet materialised and occurrences
+        # counts how many have been, so catch-up can resume exactly where it left off.
+        cur.execute('''CREATE TABLE IF NOT EXISTS recurring_rules
+                       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        book_id INTEGER NOT NULL,
+                        description TEXT,
+                        amount_cents INTEGER NOT NULL,
+                        category TEXT,
+                        frequency TEXT NOT NULL,
+                        interval INTEGER NOT NULL DEFAULT 1,
+                        start_date TEXT NOT NULL,
+                        end_date TEXT,
+                        next_date TEXT NOT NULL,
+                        occurrences INTEGER NOT NULL DEFAULT 0)''')
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_recurring_next_date ON recurring_rules (next_date)')
+        # category_rules map description keywords (and optional amount ranges)
+        # to categories; lower priority values are tried first.
+        cur.execute('''CREATE TABLE IF NOT EXISTS category_rules
+                       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        pattern TEXT NOT NULL,
+                        category TEXT NOT NULL,
+                        min_cents INTEGER,
+                        max_cents INTEGER,
+                        priority INTEGER NOT NULL DEFAULT 100)''')
+        # Schema version 1 stored money as REAL dollars, so long SUMs drifted.
+        # Convert those columns to integer cents; month_totals is derived data and
+        # is simply rebuilt below (its triggers reference the old column).
+        cur.execute("PRAGMA table_info(transactions)")
+        if 'amount' in [r[1] for r in cur.fetchall()]:
+            for trigger in ('month_totals_insert', 'month_totals_delete', 'month_totals_update'):
+                cur.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            cur.execute('DROP TABLE IF EXISTS month_totals')
+            for table in dict.fromkeys(t for t, _, _ in CENTS_COLUMNS):
+                cur.execute(f'PRAGMA table_info({table})')
+                if {old for t, old, _ in CENTS_COLUMNS if t == table} & {r[1] for r in cur.fetchall()}:
+                    convert_to_cents(cur, table)
+        # month_totals holds the month-to-date total per book/category (month is
+        # 'YYYY-MM'). Backfill it from existing transactions the first time.
+        cur.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'month_totals'")
+        backfill = cur.fetchone()[0] == 0
+        cur.execute('''CREATE TABLE IF NOT EXISTS month_totals
+                       (book_id INTEGER NOT NULL,
+                        category TEXT NOT NULL,
+                        month TEXT NOT NULL,
+                        total_cents INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (book_id, category, month))''')
+        if backfill:
+            cur.execute('''INSERT INTO month_totals (book_id, category, month, total_cents)
+                           SELECT COALESCE(book_id, 0), COALESCE(category, ''), substr(date, 1, 7), SUM(amount_cents)
+                           FROM transactions GROUP BY 1, 2, 3''')
+        for trigger in MONTH_TOTALS_TRIGGERS:
+            cur.execute(trigger)
+        # data_versions backs the ETags of cacheable pages and exports
+        cur.execute('''CREATE TABLE IF NOT EXISTS data_versions
+                       (scope TEXT PRIMARY KEY,
+                        version INTEGER NOT NULL DEFAULT 0)''')
+        for trigger in DATA_VERSION_TRIGGERS:
+            cur.execute(trigger)
+        cur.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         con.commit()
+    if SHARD_DIR:
+        move_transactions_to_shards()
+    # catch up on any recurring transactions that fell due while the app was closed
+    materialise_recurring()
+
+
+# A book file holds the book's transactions plus the month_totals and
+# data_versions rows derived from them, maintained by the same triggers.
+SHARD_TRIGGERS = MONTH_TOTALS_TRIGGERS + [t for t in DATA_VERSION_TRIGGERS if ' ON transactions' in t]
+
+
+def shard_path(book_id):
+    return os.path.join(SHARD_DIR, f'book-{book_id}.db')
+
+
+def open_shard(book_id):
+    """Open (creating if needed) a book file, with the catalog attached as `catalog`.
+
+    Tables that only exist in the catalog (books, budgets, rules, ...) resolve
+    unqualified on this connection, so queries joining them with a book's
+    transactions or month_totals work unchanged. Raises ValueError rather than
+    creating a file for a book that is not in the catalog.
+    """
+    if not os.path.exists(shard_path(book_id)) and not book_exists(book_id):
+        raise ValueError('Book not found')
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    con = sqlite.connect(shard_path(book_id), check_same_thread=False)
+    cur = con.cursor()
+    cur.execute('''CREATE TABLE IF NOT EXISTS transactions
+                   (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT,
+                    description TEXT,
+                    amount_cents INTEGER NOT NULL DEFAULT 0,
+                    category TEXT,
+                    book_id INTEGER)''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS month_totals
+                   (book_id INTEGER NOT NULL,
+                    category TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    total_cents INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (book_id, category, month))''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS data_versions
+                   (scope TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0)''')
+    # triggers are created before the catalog is attached so they bind to this file's tables
+    for trigger in SHARD_TRIGGERS:
+        cur.execute(trigger)
+    cur.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    con.commit()
+    cur.execute('ATTACH DATABASE ? AS catalog', (DATABASE,))
+    return con
+
+
+class Shard:
+    """An open book file lent out by ShardPool."""
+
+    def __init__(self, con):
+        self.con = con
+        self.lock = threading.RLock()
+        self.users = 0
+        self.discarded = False
+
+
+class ShardPool:
+    """Bounded LRU of open book-file connections.
+
+    A connection is used by one thread at a time (see book_connection). When
+    more than `size` books are open the least recently used idle connection is
+    closed; connections in use are never closed, so the pool can briefly grow
+    past `size` under load.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._shards = OrderedDict()
+
+    def checkout(self, book_id):
+        with self._lock:
+            shard = self._shards.get(book_id)
+            if shard is not None:
+                shard.users += 1
+                self._shards.move_to_end(book_id)
+                return shard
+        # opening may create the file and its schema, so do it outside the pool lock
+        con = open_shard(book_id)
+        with self._lock:
+            shard = self._shards.get(book_id)
+            if shard is None:
+                shard = self._shards[book_id] = Shard(con)
+            else:
+                con.close()  # another thread opened it first
+            shard.users += 1
+            self._shards.move_to_end(book_id)
+            self._evict()
+        return shard
+
+    def checkin(self, shard):
+        with self._lock:
+            shard.users -= 1
+            if shard.discarded and shard.users == 0:
+                shard.con.close()
+            self._evict()
+
+    def discard(self, book_id):
+        """Forget a book's connection, closing it as soon as nobody is using it."""
+        with self._lock:
+            shard = self._shards.pop(book_id, None)
+            if shard is not None:
+                shard.discarded = True
+                if shard.users == 0:
+                    shard.con.close()
+
+    def close_all(self):
+        with self._lock:
+            book_ids = list(self._shards)
+        for book_id in book_ids:
+            self.discard(book_id)
+
+    def _evict(self):
+        for book_id in list(self._shards):
+            if len(self._shards) <= self.size:
+                break
+            shard = self._shards[book_id]
+            if shard.users == 0:
+                del self._shards[book_id]
+                shard.con.close()
+
+
+_shard_pool = ShardPool(SHARD_POOL_SIZE)
+
+
+@contextmanager
+def book_connection(book_id):
+    """Connection on which `transactions` and `month_totals` are the given book's.
+
+    In single-file mode this is a plain connection to DATABASE. In sharded
+    mode it is the book file's pooled connection, held by this thread until
+    the block exits. Either way the block commits on success and rolls back
+    on an exception, like `with sqlite.connect(...)`.
+    """
+    if not SHARD_DIR:
+        with sqlite.connect(DATABASE) as con:
+            yield con
+        return
+    shard = _shard_pool.checkout(book_id)
+    try:
+        with shard.lock, shard.con:
+            yield shard.con
+    finally:
+        _shard_pool.checkin(shard)
+
+
+def drop_shard(book_id):
+    """Close and delete a book's file (sharded mode only)."""
+    _shard_pool.discard(book_id)
+    if os.path.exists(shard_path(book_id)):
+        os.remove(shard_path(book_id))
+
+
+def move_transactions_to_shards():
+    """Move transactions still held in the catalog into their books' files.
+
+    Runs when sharded mode is switched on for an existing single-file database
+    and after a restore. Each book moves in one transaction spanning both
+    files, so an interrupted run leaves no row in both places or in neither.
+    Transaction ids are reassigned by the book file.
+    """
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        cur.execute('SELECT DISTINCT book_id FROM transactions WHERE book_id IN (SELECT id FROM books)')
+        book_ids = [r[0] for r in cur.fetchall()]
+    for book_id in book_ids:
+        with book_connection(book_id) as con:
+            cur = con.cursor()
+            cur.execute('''INSERT INTO main.transactions (date, description, amount_cents, category, book_id)
+                           SELECT date, description, amount_cents, category, book_id
+                           FROM catalog.transactions WHERE book_id = ? ORDER BY id''', (book_id,))
+            cur.execute('DELETE FROM catalog.transactions WHERE book_id = ?', (book_id,))
+    if book_ids:
+        logger.info('Moved transactions of %d book(s) into %s', len(book_ids), SHARD_DIR)
+
+
+def query_all_books(sql, params=()):
+    """Run `sql` over every book's transactions and return the rows as one DataFrame.
+
+    `sql` is a SELECT reading from `{transactions}`. In single-file mode it runs
+    once against the shared table. In sharded mode the book files are ATTACHed
+    to a catalog connection SHARD_ATTACH_LIMIT at a time and one copy of `sql`
+    per book is combined with UNION ALL, so a query that groups should group by
+    book_id (or be re-aggregated by the caller).
+    """
+    if not SHARD_DIR:
+        with sqlite.connect(DATABASE) as con:
+            return pd.read_sql_query(sql.format(transactions='transactions'), con, params=params)
+    _, books = get_books()
+    book_ids = [b['id'] for b in books if os.path.exists(shard_path(b['id']))]
+    frames = []
+    with closing(sqlite.connect(DATABASE)) as con:
+        cur = con.cursor()
+        for start in range(0, len(book_ids), SHARD_ATTACH_LIMIT):
+            chunk = book_ids[start:start + SHARD_ATTACH_LIMIT]
+            for i, book_id in enumerate(chunk):
+                cur.execute(f'ATTACH DATABASE ? AS shard{i}', (shard_path(book_id),))
+            try:
+                union = ' UNION ALL '.join(sql.format(transactions=f'shard{i}.transactions') for i in range(len(chunk)))
+                frames.append(pd.read_sql_query(union, con, params=list(params) * len(chunk)))
+            finally:
+                for i in range(len(chunk)):
+                    cur.execute(f'DETACH DATABASE shard{i}')
+    if not frames:
+        with sqlite.connect(DATABASE) as con:
+            # run once on the (empty) catalog table to get the right columns
+            return pd.read_sql_query(sql.format(transactions='transactions'), con, params=params).head(0)
+    return pd.concat(frames, ignore_index=True)
+
+
+def occurrence_date(start, frequency, interval, n):
+    """Return the date of the n-th (0-based) occurrence of a recurring rule.
+
+    Monthly rules keep the day of month of `start`, clamped to the month length,
+    so a rule starting on the 31st falls on the 28th/29th in February and goes
+    back to the 31st afterwards.
+    """
+    if frequency == 'daily':
+        return start + timedelta(days=n * interval)
+    if frequency == 'weekly':
+        return start + timedelta(weeks=n * interval)
+    months = start.month - 1 + n * interval
+    year, month = start.year + months // 12, months % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def materialise_recurring(today=None):
+    """Insert every due occurrence of every recurring rule in one transaction.
+
+    Safe to call repeatedly: each rule's next_date/occurrences advance in the same
+    transaction as the inserts, and BEGIN IMMEDIATE keeps two schedulers from
+    materialising the same occurrences concurrently. Returns the number of
+    transactions inserted. In sharded mode each book is materialised in its own
+    transaction, spanning the book file and the catalog's recurring_rules.
+    """
+    today = (today or date.today()).isoformat()
+    if SHARD_DIR:
+        with sqlite.connect(DATABASE) as con:
+            cur = con.cursor()
+            cur.execute(f'SELECT DISTINCT book_id FROM recurring_rules WHERE {RECURRING_DUE}', (today,))
+            book_ids = [r[0] for r in cur.fetchall()]
+        count = 0
+        for book_id in book_ids:
+            with book_connection(book_id) as con:
+                count += _materialise_due(con, today, book_id)
+    else:
+        with sqlite.connect(DATABASE) as con:
+            count = _materialise_due(con, today)
+    if count:
+        logger.info('Materialised %d recurring transaction(s)', count)
+    return count
+
+
+def _materialise_due(con, today, book_id=None):
+    """Materialise the due rules (of one book, if given) on `con`; return the insert count."""
+    cur = con.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    query = f'''SELECT id, book_id, description, amount_cents, category, frequency, interval,
+                       start_date, end_date, next_date, occurrences
+                FROM recurring_rules WHERE {RECURRING_DUE}'''
+    params = [today]
+    if book_id is not None:
+        query += ' AND book_id = ?'
+        params.append(book_id)
+    cur.execute(query, params)
+    inserts, updates = [], []
+    for (rule_id, book_id, description, amount_cents, category, frequency, interval,
+         start_date, end_date, next_date, occurrences) in cur.fetchall():
+        start = date.fromisoformat(start_date)
+        due = next_date
+        while due <= today and (end_date is None or due <= end_date):
+            inserts.append((due, description, amount_cents, category, book_id))
+            occurrences += 1
+            due = occurrence_date(start, frequency, interval, occurrences).isoformat()
+        updates.append((due, occurrences, rule_id))
+    cur.executemany('INSERT INTO transactions (date, description, amount_cents, category, book_id) VALUES (?, ?, ?, ?, ?)', inserts)
+    cur.executemany('UPDATE recurring_rules SET next_date = ?, occurrences = ? WHERE id = ?', updates)
+    con.commit()
+    return len(inserts)
+
+
+_started_jobs = set()
+
+
+def start_periodic_job(name, func, interval, first_delay=None):
+    """Run `func` every `interval` seconds on a daemon thread; starting `name` twice is a no-op.
+
+    The first run is after `first_delay` seconds (default `interval`; 0 runs it right away).
+    """
+    if name in _started_jobs:
+        return
+    _started_jobs.add(name)
+
+    def run():
+        stop = threading.Event()
+        delay = interval if first_delay is None else first_delay
+        while not stop.wait(delay):
+            delay = interval
+            try:
+                func()
+            except Exception:
+                logger.exception('Background job %s failed', name)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+
+
+def start_recurring_scheduler(interval=RECURRING_INTERVAL):
+    """Start a daemon thread that materialises recurring transactions every `interval` seconds."""
+    start_periodic_job('recurring-scheduler', materialise_recurring, interval)
+
+
+def backup_database(compress=False, dest_dir=BACKUP_DIR):
+    """Write a consistent snapshot of the live database and return its path.
+
+    Uses the SQLite online backup API in steps of BACKUP_PAGES pages, so
+    requests can keep writing while the copy runs (a write between steps makes
+    SQLite restart the copy, which still yields a consistent snapshot).
+    In sharded mode the book files are merged into the copy, so a backup is
+    always one single-file database.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    path = os.path.join(dest_dir, f'accounting-{datetime.now():%Y%m%d-%H%M%S-%f}.db')
+    partial = path + '.partial'
+    with closing(sqlite.connect(DATABASE)) as src, closing(sqlite.connect(partial)) as dst:
+        src.backup(dst, pages=BACKUP_PAGES, sleep=0.005)
+    if SHARD_DIR:
+        merge_shards(partial)
+    if compress:
+        with open(partial, 'rb') as f_in, gzip.open(path + '.gz', 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(partial)
+        return path + '.gz'
+    os.replace(partial, path)
+    return path
+
+
+def merge_shards(path):
+    """Copy every book file's transactions into the single-file database at `path`.
+
+    Each book is read in its own snapshot, so every book is consistent but
+    books are not frozen at exactly the same instant. Transaction ids are
+    reassigned because book files number their rows independently.
+    """
+    with closing(sqlite.connect(path)) as con:
+        cur = con.cursor()
+        cur.execute('SELECT id FROM books')
+        for (book_id,) in cur.fetchall():
+            if not os.path.exists(shard_path(book_id)):
+                continue
+            cur.execute('ATTACH DATABASE ? AS shard', (shard_path(book_id),))
+            cur.execute('''INSERT INTO transactions (date, description, amount_cents, category, book_id)
+                           SELECT date, description, amount_cents, category, book_id
+                           FROM shard.transactions ORDER BY id''')
+            con.commit()
+            cur.execute('DETACH DATABASE shard')
+
+
+def list_backups(dest_dir=BACKUP_DIR):
+    """Return backups in `dest_dir`, newest first, as dicts with name, size and created."""
+    if not os.path.isdir(dest_dir):
+        return []
+    rows = []
+    for name in os.listdir(dest_dir):
+        if name.startswith('accounting-') and name.endswith(('.db', '.db.gz')):
+            st = os.stat(os.path.join(dest_dir, name))
+            rows.append({'name': name, 'size': st.st_size, 'created': datetime.fromtimestamp(st.st_mtime)})
+    # names embed the timestamp, so sorting by name sorts by age
+    return sorted(rows, key=lambda r: r['name'], reverse=True)
+
+
+def rotate_backups(keep=BACKUP_RETENTION, dest_dir=BACKUP_DIR):
+    """Delete all but the `keep` newest backups; return how many were removed."""
+    stale = list_backups(dest_dir)[keep:]
+    for b in stale:
+        os.remove(os.path.join(dest_dir, b['name']))
+    return len(stale)
+
+
+def scheduled_backup():
+    backup_database(compress=True)
+    rotate_backups()
+
+
+def start_backup_scheduler(interval=BACKUP_INTERVAL):
+    """Start a daemon thread that takes a compressed, rotated backup every `interval` seconds.
+
+    The first backup is due `interval` after the newest existing one (right
+    away if that is older or there is none), not after the app started, so
+    a desktop app only ever used in short sessions still gets its backups.
+    """
+    backups = list_backups()
+    age = (datetime.now() - backups[0]['created']).total_seconds() if backups else interval
+    start_periodic_job('backup-scheduler', scheduled_backup, interval, first_delay=max(0, interval - age))
+
+
+def restore_database(path):
+    """Replace the live database with the backup at `path` (.db or .db.gz).
+
+    The backup is staged and validated first (integrity check, required tables,
+    schema version no newer than this app understands). It is then copied over
+    the live database with the backup API in a single step, so other
+    connections see either the old or the new data, never a torn file. A
+    safety backup of the current data is taken before the swap. Raises
+    ValueError if the backup is not usable.
+    """
+    staging = DATABASE + '.restore'
+    opener = gzip.open if path.endswith('.gz') else open
+    try:
+        with opener(path, 'rb') as f_in, open(staging, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        with closing(sqlite.connect(staging)) as con:
+            cur = con.cursor()
+            try:
+                cur.execute('PRAGMA quick_check')
+                check = cur.fetchone()[0]
+                cur.execute('PRAGMA user_version')
+                version = cur.fetchone()[0]
+                cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+                tables = {r[0] for r in cur.fetchall()}
+            except sqlite.DatabaseError:
+                raise ValueError('Backup is not a valid database file')
+        if check != 'ok':
+            raise ValueError(f'Backup failed its integrity check: {check}')
+        if not {'transactions', 'books', 'categories'} <= tables:
+            raise ValueError('Backup is missing accounting tables')
+        if version > SCHEMA_VERSION:
+            raise ValueError(f'Backup schema version {version} is newer than this app supports ({SCHEMA_VERSION})')
+        backup_database(compress=True)
+        if SHARD_DIR:
+            _shard_pool.close_all()
+        previous = data_version_snapshot()
+        with closing(sqlite.connect(staging)) as src, closing(sqlite.connect(DATABASE)) as dst:
+            src.backup(dst)
+        if SHARD_DIR and os.path.isdir(SHARD_DIR):
+            # backups hold every book in the single-file layout; init_db below
+            # moves them into fresh book files
+            for name in os.listdir(SHARD_DIR):
+                if name.startswith('book-') and name.endswith('.db'):
+                    os.remove(os.path.join(SHARD_DIR, name))
+    except (OSError, EOFError) as e:
+        raise ValueError(f'Could not read backup: {e}')
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+    # bring an older backup up to the current schema
+    init_db()
+    advance_data_versions(previous)
+
+
+def data_version_snapshot():
+    """Return every data_versions counter of the live data, summed over book files when sharded."""
+    paths = [DATABASE]
+    if SHARD_DIR and os.path.isdir(SHARD_DIR):
+        paths += [os.path.join(SHARD_DIR, name) for name in os.listdir(SHARD_DIR)
+                  if name.startswith('book-') and name.endswith('.db')]
+    versions = {}
+    for p in paths:
+        with closing(sqlite.connect(p)) as con:
+            for scope, version in con.execute('SELECT scope, version FROM data_versions'):
+                versions[scope] = versions.get(scope, 0) + version
+    return versions
+
+
+def advance_data_versions(previous):
+    """Move every counter past the values in `previous` (taken before a restore).
+
+    The restored counters come from an older snapshot, so without this they
+    would repeat versions already handed out in ETags and chart file names
+    and clients would be told stale pages are still current. Counters only
+    grow, so adding the old value plus one puts each scope past anything used
+    before; book files start again from their restored rows, which only adds.
+    """
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        cur.execute('SELECT id FROM books')
+        scopes = set(previous) | {'catalog', 'rules'} | {f'book:{book_id}' for (book_id,) in cur.fetchall()}
+        cur.executemany('''INSERT INTO data_versions (scope, version) VALUES (?, ?)
+                           ON CONFLICT (scope) DO UPDATE SET version = version + excluded.version''',
+                        [(scope, previous.get(scope, 0) + 1) for scope in scopes])
 
 
 def get_categories():
@@ -87,10 +851,461 @@ def get_categories():
 
 def get_books():
     with sqlite.connect(DATABASE) as con:
-        df = pd.read_sql_query('SELECT id, name FROM books ORDER BY name', con)
+        df = pd.read_sql_query('SELECT id, name, currency FROM books ORDER BY name', con)
     return df['name'].tolist(), df.to_dict(orient='records')
 
 
+def book_exists(book_id):
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        cur.execute('SELECT COUNT(*) FROM books WHERE id = ?', (book_id,))
+        return cur.fetchone()[0] > 0
+
+
+def to_cents(raw):
+    """Parse a user-entered amount such as '12.3' into integer cents (1230).
+
+    Goes through Decimal so no binary floating-point rounding is involved;
+    half-cent inputs round away from zero. Raises ValueError for non-numbers
+    and for amounts larger than MAX_AMOUNT_CENTS either way.
+    """
+    try:
+        value = Decimal(str(raw).strip())
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount: {raw!r}')
+    if not value.is_finite():
+        raise ValueError(f'Invalid amount: {raw!r}')
+    # compared in currency units so huge exponents are never multiplied out
+    if value.copy_abs() > Decimal(MAX_AMOUNT_CENTS).scaleb(-2):
+        raise ValueError(f'Amount out of range: {raw!r}')
+    return int((value * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+@app.template_filter('amount')
+def format_amount(cents):
+    """Format cents as a plain decimal string, e.g. -1230 -> '-12.30'.
+
+    Averages arrive as fractional cents and are rounded to the nearest cent.
+    """
+    cents = int(Decimal(str(cents)).to_integral_value(rounding=ROUND_HALF_UP))
+    sign = '-' if cents < 0 else ''
+    return f'{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}'
+
+
+@app.template_filter('money')
+def format_money(cents, currency=DEFAULT_CURRENCY):
+    """Format cents with the currency symbol, e.g. 1230 -> '$12.30'."""
+    return CURRENCIES.get(currency, '') + format_amount(cents)
+
+
+def trie_pattern(keywords):
+    """Build one regex matching any of `keywords`, factored by shared prefixes.
+
+    Python's re tries a plain alternation one branch at a time; the trie form
+    ('ab(?:c|d(?:e)?)' rather than 'abc|abd|abde') lets it reject most positions
+    after a single character. Greedy optional tails make it match the longest
+    keyword that starts at a position.
+    """
+    trie = {}
+    for k in keywords:
+        node = trie
+        for ch in k:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node):
+        terminal = '' in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if terminal:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class CategoryMatcher:
+    """Compiled form of the category rules.
+
+    Every rule keyword is merged into one trie-shaped regex inside a
+    lookahead, so a lower-cased description is scanned once no matter how
+    many rules exist and the longest keyword starting at each position is
+    found. Shorter keywords contained in a found one are implied by it, so the
+    result is the same as testing every rule in turn: the first rule, by
+    priority, whose keyword occurs and whose amount range fits wins.
+    """
+
+    def __init__(self, rules):
+        # rules: dicts with pattern, category, min_cents, max_cents in priority order
+        self.rules = pd.DataFrame(rules, columns=['pattern', 'category', 'min_cents', 'max_cents'])
+        self.rules['keyword'] = self.rules['pattern'].str.lower()
+        for col in ('min_cents', 'max_cents'):
+            self.rules[col] = pd.to_numeric(self.rules[col]).astype(float)
+        self.rules['rank'] = range(len(self.rules))
+        ranks = self.rules.groupby('keyword')['rank'].apply(list).to_dict()
+        # a keyword found in a description also means every keyword inside it occurs
+        self.by_keyword = {k: sorted(r for other, rs in ranks.items() if other in k for r in rs) for k in ranks}
+        # plain tuples for the single-transaction path, NaN bounds as None
+        self.ranked = [(r['category'], None if pd.isna(r['min_cents']) else r['min_cents'],
+                        None if pd.isna(r['max_cents']) else r['max_cents']) for r in rules]
+        self.regex = re.compile('(?=(' + trie_pattern(self.by_keyword) + '))') if self.by_keyword else None
+
+    def match(self, description, amount_cents):
+        """Return the category for one transaction, or None if no rule applies."""
+        if self.regex is None or not description:
+            return None
+        ranks = sorted({r for k in self.regex.findall(description.lower()) for r in self.by_keyword[k]})
+        for rank in ranks:
+            category, min_cents, max_cents = self.ranked[rank]
+            if (min_cents is None or amount_cents >= min_cents) and (max_cents is None or amount_cents <= max_cents):
+                return category
+        return None
+
+    def match_frame(self, df):
+        """Categorise a DataFrame with description and amount_cents columns in one vectorised pass.
+
+        Returns a Series of categories indexed like `df`, containing only the
+        rows some rule matched.
+        """
+        if self.regex is None or df.empty:
+            return pd.Series(dtype=object)
+        found = df['description'].fillna('').str.lower().str.findall(self.regex).explode().dropna()
+        if found.empty:
+            return pd.Series(dtype=object)
+        hits = pd.DataFrame({'row': found.index, 'keyword': found.values})
+        implied = pd.DataFrame([(k, r) for k, rs in self.by_keyword.items() for r in rs], columns=['keyword', 'rank'])
+        hits = hits.merge(implied, on='keyword').merge(self.rules[['rank', 'category', 'min_cents', 'max_cents']], on='rank')
+        hits['amount_cents'] = df['amount_cents'].reindex(hits['row']).values
+        fits = ((hits['min_cents'].isna() | (hits['amount_cents'] >= hits['min_cents']))
+                & (hits['max_cents'].isna() | (hits['amount_cents'] <= hits['max_cents'])))
+        best = hits[fits].sort_values('rank').drop_duplicates('row')
+        return pd.Series(best['category'].values, index=best['row'].values)
+
+
+_matcher_cache = {}
+
+
+def get_category_matcher():
+    """Return the compiled CategoryMatcher, recompiling only when the rules changed."""
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        cur.execute("SELECT version FROM data_versions WHERE scope = 'rules'")
+        row = cur.fetchone()
+        version = row[0] if row else 0
+        if _matcher_cache.get('version') != version:
+            df = pd.read_sql_query(
+                'SELECT pattern, category, min_cents, max_cents FROM category_rules ORDER BY priority, id', con)
+            _matcher_cache.update(version=version, matcher=CategoryMatcher(df.to_dict(orient='records')))
+    return _matcher_cache['matcher']
+
+
+def recategorise_book(book_id, only_category=None):
+    """Apply the category rules to every transaction of a book; return how many changed.
+
+    Matching runs in one vectorised pass over the whole book and all changes are
+    written with a single UPDATE joined against a temp table. Pass
+    `only_category` (e.g. 'Other') to leave transactions in other categories alone.
+    """
+    matcher = get_category_matcher()
+    with book_connection(book_id) as con:
+        query = 'SELECT id, description, amount_cents, category FROM transactions WHERE book_id = ?'
+        params = [book_id]
+        if only_category is not None:
+            query += ' AND category = ?'
+            params.append(only_category)
+        df = pd.read_sql_query(query, con, params=params, index_col='id')
+        matched = matcher.match_frame(df)
+        changed = matched[matched != df['category'].reindex(matched.index)]
+        if changed.empty:
+            return 0
+        cur = con.cursor()
+        cur.execute('CREATE TEMP TABLE IF NOT EXISTS recategorise (id INTEGER PRIMARY KEY, category TEXT)')
+        cur.execute('DELETE FROM temp.recategorise')
+        cur.executemany('INSERT INTO temp.recategorise (id, category) VALUES (?, ?)',
+                        zip(changed.index.tolist(), changed.tolist()))
+        cur.execute('''UPDATE transactions
+                       SET category = (SELECT r.category FROM temp.recategorise r WHERE r.id = transactions.id)
+                       WHERE id IN (SELECT id FROM temp.recategorise)''')
+        cur.execute('DROP TABLE temp.recategorise')
+        con.commit()
+    return len(changed)
+
+
+def check_budget(cur, book_id, category, month, amount_cents, currency=DEFAULT_CURRENCY):
+    """Return a warning message if adding `amount_cents` crossed a budget threshold.
+
+    Reads the budget and the month-to-date running total by primary key, so the
+    check costs the same no matter how many transactions the month holds.
+    Must be called on the same cursor right after the insert.
+    """
+    cur.execute(
+        '''SELECT b.limit_cents, b.alert_threshold, COALESCE(m.total_cents, 0)
+           FROM budgets b LEFT JOIN month_totals m
+             ON m.book_id = b.book_id AND m.category = b.category AND m.month = ?
+           WHERE b.book_id = ? AND b.category = ?''',
+        (month, book_id, category),
+    )
+    row = cur.fetchone()
+    if row is None or amount_cents <= 0:
+        return None
+    limit, threshold, total = row
+    previous = total - amount_cents
+    if previous < limit <= total:
+        return (f'Budget exceeded: {category} is at {format_money(total, currency)} '
+                f'of its {format_money(limit, currency)} monthly budget.')
+    if previous < limit * threshold <= total:
+        return (f'Budget warning: {category} has reached {total / limit * 100:.0f}% '
+                f'of its {format_money(limit, currency)} monthly budget.')
+    return None
+
+
+def get_budget_progress(book_id, month):
+    """Return budgets for a book with the month-to-date spend for `month`."""
+    with book_connection(book_id) as con:
+        df = pd.read_sql_query(
+            '''SELECT b.id, b.category, b.limit_cents, b.alert_threshold, COALESCE(m.total_cents, 0) AS spent_cents
+               FROM budgets b LEFT JOIN month_totals m
+                 ON m.book_id = b.book_id AND m.category = b.category AND m.month = ?
+               WHERE b.book_id = ? ORDER BY b.category''',
+            con, params=(month, book_id)
+        )
+    rows = df.to_dict(orient='records')
+    for r in rows:
+        r['percentage'] = (r['spent_cents'] / r['limit_cents'] * 100) if r['limit_cents'] > 0 else 0
+    return rows
+
+
+def get_data_version(scope):
+    """Return the current data_versions counter for `scope` (0 if it never changed)."""
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        cur.execute('SELECT version FROM data_versions WHERE scope = ?', (scope,))
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def get_book_version(book_id):
+    """Version counter covering a book's transactions and budgets.
+
+    In sharded mode transaction changes are counted in the book file and
+    budget changes in the catalog; both only grow, so their sum still changes
+    on every write.
+    """
+    version = get_data_version(f'book:{book_id}')
+    if SHARD_DIR:
+        with book_connection(book_id) as con:
+            cur = con.cursor()
+            cur.execute('SELECT version FROM main.data_versions WHERE scope = ?', (f'book:{book_id}',))
+            row = cur.fetchone()
+            version += row[0] if row else 0
+    return version
+
+
+def chart_filename(book_id, version, chart_type, size, fmt):
+    return f'book{book_id}-v{version}-{chart_type}-{size}.{fmt}'
+
+
+def render_chart(book_id, chart_type, size, fmt, path):
+    """Draw a book's pie or monthly trend chart and save it to `path`.
+
+    Uses matplotlib's object-oriented Figure API (no pyplot global state).
+    Returns False without writing anything when there is nothing to plot.
+    """
+    with book_connection(book_id) as con:
+        if chart_type == 'pie':
+            df = pd.read_sql_query(
+                """SELECT COALESCE(category, 'Uncategorized') AS label, SUM(amount_cents) AS total
+                   FROM transactions WHERE book_id = ? GROUP BY category HAVING total > 0 ORDER BY total DESC""",
+                con, params=(book_id,)
+            )
+        else:
+            df = pd.read_sql_query(
+                """SELECT month AS label, SUM(total_cents) AS total FROM month_totals
+                   WHERE book_id = ? GROUP BY month ORDER BY month""",
+                con, params=(book_id,)
+            )
+    if df.empty:
+        return False
+
+    # the chart is a display boundary, so cents become currency units here
+    values = df['total'] / 100
+    width, height = CHART_SIZES[size]
+    fig = Figure(figsize=(width / CHART_DPI, height / CHART_DPI), dpi=CHART_DPI)
+    ax = fig.subplots()
+    if chart_type == 'pie':
+        ax.pie(values, labels=df['label'], autopct='%1.1f%%', startangle=90, counterclock=False,
+               explode=[0.05] + [0] * (len(df) - 1),  # pull out the largest slice, as the report does
+               wedgeprops={'linewidth': 2, 'edgecolor': 'white'})
+        ax.set_title('Spending by Category')
+        ax.axis('equal')
+    else:
+        positions = list(range(len(df)))
+        ax.bar(positions, values, color='#0d6efd')
+        ax.set_title('Monthly Spending')
+        # label at most ~12 months so long histories stay readable
+        step = -(-len(df) // 12)
+        ax.set_xticks(positions[::step], df['label'][::step], rotation=45)
+        ax.grid(axis='y', alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(path, format=fmt)
+    return True
+
+
+def _render_chart_file(book_id, version, chart_type, size, fmt):
+    os.makedirs(CHART_DIR, exist_ok=True)
+    name = chart_filename(book_id, version, chart_type, size, fmt)
+    path = os.path.join(CHART_DIR, name)
+    partial = path + '.partial'
+    if not render_chart(book_id, chart_type, size, fmt, partial):
+        return None
+    os.replace(partial, path)
+    # the same chart at an older data version can never be served again
+    prefix, suffix = f'book{book_id}-v', f'-{chart_type}-{size}.{fmt}'
+    for old in os.listdir(CHART_DIR):
+        stamp = old[len(prefix):-len(suffix)]
+        if old.startswith(prefix) and old.endswith(suffix) and stamp.isdigit() and int(stamp) < version:
+            os.remove(os.path.join(CHART_DIR, old))
+    return path
+
+
+# matplotlib is not thread-safe, so a single worker renders every chart; it
+# also keeps slow renders off the request threads and dedupes identical work
+_chart_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chart-renderer')
+_chart_jobs = {}
+_chart_lock = threading.Lock()
+
+
+def request_chart(book_id, chart_type, size='medium', fmt='png'):
+    """Return a Future for the path of a book's chart image.
+
+    Images are cached on disk by (book_id, data version, chart type, size), so
+    any write to the book produces a new file name. A cache hit resolves
+    immediately; a miss queues one render on the chart worker, shared by all
+    callers asking for the same image. The result is None when the book has
+    nothing to chart.
+    """
+    version = get_book_version(book_id)
+    path = os.path.join(CHART_DIR, chart_filename(book_id, version, chart_type, size, fmt))
+    with _chart_lock:
+        if os.path.exists(path):
+            future = Future()
+            future.set_result(path)
+            return future
+        future = _chart_jobs.get(path)
+        if future is None:
+            future = _chart_executor.submit(_render_chart_file, book_id, version, chart_type, size, fmt)
+            _chart_jobs[path] = future
+            future.add_done_callback(lambda f: _chart_jobs.pop(path, None))
+    return future
+
+
+def get_chart(book_id, chart_type, size='medium', fmt='png'):
+    """Path of a book's chart image, waiting up to CHART_TIMEOUT seconds for a render."""
+    return request_chart(book_id, chart_type, size, fmt).result(timeout=CHART_TIMEOUT)
+
+
+def make_etag(name, *parts, book_id=None):
+    """Build a strong ETag for a page from the data versions it depends on.
+
+    Every page depends on the catalog (navbar book list) and the selected book;
+    pass `book_id` to also include that book's transaction/budget version. Only
+    the tiny data_versions table is read, so this is cheap enough to run before
+    any of a route's real queries. The deploy token makes an upgrade (new
+    code, templates or assets) invalidate pages whose data did not change.
+    """
+    versions = [get_data_version('catalog')]
+    if book_id is not None:
+        versions.append(get_book_version(book_id))
+    key = [name, _deploy_token, session.get('book_id')] + versions + list(parts)
+    return hashlib.sha1(json.dumps(key, default=str).encode()).hexdigest()
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already has `etag`, else None."""
+    # pending flash messages are rendered into the page, so never answer 304 then
+    if session.get('_flashes') or not request.if_none_match.contains(etag):
+        return None
+    return cacheable(app.response_class(status=304), etag)
+
+
+def cacheable(response, etag):
+    """Attach `etag` and make the browser revalidate it on every navigation."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def load_asset_manifest():
+    try:
+        with open(ASSET_MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def compute_deploy_token():
+    """Hash of this module, the templates and the asset manifest.
+
+    Identical for every process running the same release, and different as
+    soon as any of them changes, so it can key cached pages across upgrades.
+    """
+    template_dir = os.path.join(app.root_path, 'templates')
+    paths = [os.path.abspath(__file__), ASSET_MANIFEST]
+    if os.path.isdir(template_dir):
+        paths += [os.path.join(template_dir, name) for name in sorted(os.listdir(template_dir))]
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                digest.update(path.encode() + b'\0' + f.read())
+        except OSError:
+            continue  # e.g. a frozen bundle without the .py source
+    return digest.hexdigest()[:16]
+
+
+_asset_manifest = load_asset_manifest()
+_deploy_token = compute_deploy_token()
+
+
+@app.template_global()
+def asset_url(name):
+    """URL of a vendored asset by logical name, falling back to its CDN when not built."""
+    hashed = _asset_manifest.get(name)
+    if hashed is None:
+        return ASSET_FALLBACK_URLS[name]
+    return url_for('static', filename=f'vendor/{hashed}')
+
+
+@app.route('/static/<path:filename>', endpoint='static')
+def serve_static(filename):
+    """Serve static files, preferring precompressed .br/.gz variants the client accepts.
+
+    Fingerprinted vendor assets never change under the same name, so they are
+    marked immutable for a year; anything else falls back to revalidation.
+    """
+    path = safe_join(STATIC_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        return 'Not Found', 404
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    encoding = None
+    for enc, ext in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[enc] and os.path.isfile(path + ext):
+            path, encoding = path + ext, enc
+            break
+    immutable = filename.startswith('vendor/') and os.path.basename(filename) in _asset_manifest.values()
+    response = send_file(path, mimetype=mimetype, max_age=31536000 if immutable else None)
+    # send_file names the file it was given (e.g. "x.css.gz"), which is wrong for a variant
+    response.headers.pop('Content-Disposition', None)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 @app.context_processor
 def inject_books():
     # make books and current_book available to all templates
@@ -103,7 +1318,8 @@ def inject_books():
             if r['id'] == current_book_id:
                 current_book = r
                 break
-    return dict(books=rows, current_book=current_book)
+    currency_symbol = CURRENCIES.get(current_book['currency'], '') if current_book else CURRENCIES[DEFAULT_CURRENCY]
+    return dict(books=rows, current_book=current_book, currencies=CURRENCIES, currency_symbol=currency_symbol)
 
 
 def find_current_book():
@@ -211,17 +1427,75 @@ def edit_category(cat_id):
     return render_template('edit_category.html', row=row)
 
 
+@app.route('/rules', methods=['GET', 'POST'])
+def manage_rules():
+    """List and create auto-categorisation rules."""
+    if request.method == 'POST':
+        pattern = request.form.get('pattern', '').strip()
+        category = request.form.get('category', '').strip()
+        try:
+            min_raw, max_raw = request.form.get('min_amount', ''), request.form.get('max_amount', '')
+            min_cents = to_cents(min_raw) if min_raw else None
+            max_cents = to_cents(max_raw) if max_raw else None
+            priority = int(request.form.get('priority', '') or 100)
+        except ValueError:
+            flash('Amounts and priority must be numbers', 'error')
+            return redirect(url_for('manage_rules'))
+        if not pattern or not category:
+            flash('A rule needs a keyword and a category', 'error')
+        elif category not in get_categories()[0]:
+            flash('Category not found', 'error')
+        else:
+            with sqlite.connect(DATABASE) as con:
+                cur = con.cursor()
+                cur.execute('INSERT INTO category_rules (pattern, category, min_cents, max_cents, priority) VALUES (?, ?, ?, ?, ?)',
+                            (pattern, category, min_cents, max_cents, priority))
+                con.commit()
+            flash('Rule added', 'success')
+        return redirect(url_for('manage_rules'))
+
+    with sqlite.connect(DATABASE) as con:
+        df = pd.read_sql_query('SELECT id, pattern, category, min_cents, max_cents, priority FROM category_rules ORDER BY priority, id', con)
+    rows = df.astype(object).where(df.notna(), None).to_dict(orient='records')
+    categories, _ = get_categories()
+    return render_template('rules.html', rows=rows, categories=categories)
+
+
+@app.route('/rules/delete/<int:rule_id>', methods=['POST'])
+def delete_rule(rule_id):
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        cur.execute('DELETE FROM category_rules WHERE id = ?', (rule_id,))
+        con.commit()
+    flash('Rule deleted', 'success')
+    return redirect(url_for('manage_rules'))
+
+
+@app.route('/rules/apply', methods=['POST'])
+def apply_rules():
+    """Re-categorise the whole current book with the rules."""
+    r = ensure_book_selected()
+    if r:
+        return r
+    changed = recategorise_book(session.get('book_id'), only_category='Other' if request.form.get('only_other') else None)
+    flash(f'Re-categorised {changed} transaction(s)', 'success')
+    return redirect(url_for('manage_rules'))
+
+
 @app.route('/books', methods=['GET', 'POST'])
 def manage_books():
     if request.method == 'POST':
         name = request.form.get('name', '').strip()
+        currency = request.form.get('currency', DEFAULT_CURRENCY)
         if not name:
             flash('Book name cannot be empty', 'error')
+        elif currency not in CURRENCIES:
+            flash('Unsupported currency', 'error')
         else:
             try:
                 with sqlite.connect(DATABASE) as con:
                     cur = con.cursor()
-                    cur.execute('INSERT INTO books (name) VALUES (?)', (name,))
+                    cur.execute('INSERT INTO books (name, currency) VALUES (?, ?)', (name, currency))
                     con.commit()
                 flash('Book added', 'success')
             except sqlite.IntegrityError:
@@ -233,16 +1507,24 @@ def manage_books():
 
 @app.route('/books/delete/<int:book_id>', methods=['POST'])
 def delete_book(book_id):
+    if not book_exists(book_id):
+        flash('Book not found', 'error')
+        return redirect(url_for('manage_books'))
     # Prevent deleting a book that still has transactions.
-    with sqlite.connect(DATABASE) as con:
+    with book_connection(book_id) as con:
         cur = con.cursor()
         cur.execute('SELECT COUNT(*) FROM transactions WHERE book_id = ?', (book_id,))
         cnt = cur.fetchone()[0]
         if cnt > 0:
-            flash('Cannot delete a book that has transactions. Move or delete transactions first.', 'error')
+            flash('Cannot delete a book that has transactions. Select them on the book page and move or delete them first.', 'error')
             return redirect(url_for('manage_books'))
         cur.execute('DELETE FROM books WHERE id = ?', (book_id,))
+        # drop the book's budgets and recurring rules so nothing is materialised into it
+        cur.execute('DELETE FROM budgets WHERE book_id = ?', (book_id,))
+        cur.execute('DELETE FROM recurring_rules WHERE book_id = ?', (book_id,))
         con.commit()
+    if SHARD_DIR:
+        drop_shard(book_id)
     flash('Book deleted', 'success')
     # if the deleted book was selected, clear selection
     if session.get('book_id') == book_id:
@@ -254,20 +1536,22 @@ def delete_book(book_id):
 def edit_book(book_id):
     if request.method == 'POST':
         name = request.form.get('name', '').strip()
-        if not name:
+        currency = request.form.get('currency', DEFAULT_CURRENCY)
+        if not name or currency not in CURRENCIES:
             flash('Book name cannot be empty', 'error')
             return redirect(url_for('edit_book', book_id=book_id))
         try:
             with sqlite.connect(DATABASE) as con:
                 cur = con.cursor()
-                cur.execute('UPDATE books SET name = ? WHERE id = ?', (name, book_id))
+                # currency only changes how amounts are labelled; nothing is converted
+                cur.execute('UPDATE books SET name = ?, currency = ? WHERE id = ?', (name, currency, book_id))
                 con.commit()
             flash('Book updated', 'success')
         except sqlite.IntegrityError:
             flash('Another book with that name exists', 'error')
         return redirect(url_for('manage_books'))
     with sqlite.connect(DATABASE) as con:
-        df = pd.read_sql_query('SELECT id, name FROM books WHERE id = ?', con, params=(book_id,))
+        df = pd.read_sql_query('SELECT id, name, currency FROM books WHERE id = ?', con, params=(book_id,))
     if df.empty:
         return redirect(url_for('manage_books'))
     row = df.to_dict(orient='records')[0]
@@ -293,9 +1577,13 @@ def index():
                 flash('Book already exists', 'error')
         return redirect(url_for('index'))
     
+    etag = make_etag('book_list')
+    cached = not_modified(etag)
+    if cached:
+        return cached
     names, books = get_books()
     # render a list of books the user can click into (empty list is fine)
-    return render_template('book_list.html', rows=books)
+    return cacheable(make_response(render_template('book_list.html', rows=books)), etag)
 
 
 @app.route('/book/<int:book_id>')
@@ -314,11 +1602,110 @@ def view_book(book_id: int):
         return redirect(url_for('index'))
     # set the session selection so other pages know the current book
     session['book_id'] = book_id
+    etag = make_etag('view_book', book_id=book_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
     # query transactions for this book and show the transactions page
-    with sqlite.connect(DATABASE) as con:
-        df = pd.read_sql_query("SELECT id, description, amount, category FROM transactions WHERE book_id = ?", con, params=(book_id,))
+    with book_connection(book_id) as con:
+        df = pd.read_sql_query("SELECT id, description, amount_cents, category FROM transactions WHERE book_id = ?", con, params=(book_id,))
     rows = df.to_dict(orient='records')
-    return render_template('index.html', rows=rows)
+    categories, _ = get_categories()
+    return cacheable(make_response(render_template('index.html', rows=rows, categories=categories)), etag)
+def insert_transaction(cur, book_id, row, currency):
+    """Insert one (date, description, amount_cents, category) row and return its budget alert."""
+    date, description, amount_cents, category = row
+    cur.execute("INSERT INTO transactions (date, description, amount_cents, category, book_id) VALUES (?, ?, ?, ?, ?)",
+                (date, description, amount_cents, category, book_id))
+    return check_budget(cur, book_id, category, date[:7], amount_cents, currency)
+
+
+class TransactionWriter:
+    """Single writer thread that group-commits new transactions.
+
+    submit() queues a row and returns a Future. The writer takes every row
+    already queued (they arrive while the previous batch commits); if that
+    shows other writers are active it keeps collecting for up to
+    GROUP_COMMIT_WINDOW seconds, so a lone request is never delayed. The batch
+    (at most GROUP_COMMIT_MAX_BATCH rows) is written in one transaction per
+    database file. Each Future then resolves to that row's budget alert (or
+    None). Budget checks run in queue order inside the batch, so each row sees
+    the rows before it exactly as with separate commits. If a batch fails, its
+    rows are retried one per transaction so one bad row cannot fail the rest.
+    """
+
+    def __init__(self, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name='transaction-writer', daemon=True).start()
+
+    def submit(self, book_id, row, currency=DEFAULT_CURRENCY):
+        future = Future()
+        self._queue.put((book_id, row, currency, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            deadline = time.monotonic() + self.window
+            while 1 < len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        # every book shares one file unless sharded, so one transaction covers the batch
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[0] if SHARD_DIR else None, []).append(item)
+        for key, items in groups.items():
+            try:
+                with book_connection(key) as con:
+                    cur = con.cursor()
+                    alerts = [insert_transaction(cur, book_id, row, currency) for book_id, row, currency, _ in items]
+            except Exception:
+                logger.exception('Group commit of %d transaction(s) failed; retrying one by one', len(items))
+                for item in items:
+                    self._write_one(item)
+                continue
+            for (*_, future), alert in zip(items, alerts):
+                future.set_result(alert)
+
+    def _write_one(self, item):
+        book_id, row, currency, future = item
+        try:
+            with book_connection(book_id) as con:
+                alert = insert_transaction(con.cursor(), book_id, row, currency)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(alert)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_transaction_writer():
+    """Return the shared TransactionWriter, starting its thread on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = TransactionWriter()
+    return _writer
+
+
 @app.route('/add', methods=['GET', 'POST'])
 def add_transaction():
     # ensure a book is selected before allowing adds
@@ -336,28 +1723,38 @@ def add_transaction():
         # validate amount
         amount_raw = request.form.get('amount', '')
         try:
-            amount = float(amount_raw)
-        except Exception:
+            amount_cents = to_cents(amount_raw)
+        except ValueError:
             from flask import flash
             flash('Amount must be a number', 'error')
             categories, _ = get_categories()
             return render_template('add.html', categories=categories, description=request.form.get('description',''), amount=amount_raw, category=request.form.get('category',''), DEFAULT_DESCRIPTION=DEFAULT_DESCRIPTION)
-        if amount == 0:
+        if amount_cents == 0:
             from flask import flash
             flash('Amount cannot be zero', 'error')
             categories, _ = get_categories()
             return render_template('add.html', categories=categories, description=request.form.get('description',''), amount=amount_raw, category=request.form.get('category',''), DEFAULT_DESCRIPTION=DEFAULT_DESCRIPTION)
 
-        category = request.form.get('category', '') or 'Other'
-        with sqlite.connect(DATABASE) as con:
-            cur = con.cursor()
-            book_id = session.get('book_id')
-            # book_id must exist because we checked earlier in ensure_book_selected
-            cur.execute("INSERT INTO transactions (date, description, amount, category, book_id) VALUES (?, ?, ?, ?, ?)",
-                        (date, description, amount, category, book_id))
-            con.commit()
+        category = request.form.get('category', '')
+        auto_category = None
+        if not category:
+            # no category chosen: let the rules pick one from the typed description
+            auto_category = get_category_matcher().match(request.form.get('description', '').strip(), amount_cents)
+            category = auto_category or 'Other'
+        # book_id must exist because we checked earlier in ensure_book_selected
+        book_id = session.get('book_id')
+        row = (date, description, amount_cents, category)
+        currency = find_current_book()['currency']
+        if GROUP_COMMIT:
+            budget_alert = get_transaction_writer().submit(book_id, row, currency).result()
+        else:
+            with book_connection(book_id) as con:
+                budget_alert = insert_transaction(con.cursor(), book_id, row, currency)
+                con.commit()
         from flask import flash
-        flash('Transaction added successfully!', 'success')
+        flash('Transaction added successfully!' + (f' (auto-categorised as {auto_category})' if auto_category else ''), 'success')
+        if budget_alert:
+            flash(budget_alert, 'warning')
         # For rapid entry, redirect back to add page instead of index
         return redirect(url_for('add_transaction'))
     
@@ -371,7 +1768,7 @@ def delete_transaction(tx_id):
     r = ensure_book_selected()
     if r:
         return r
-    with sqlite.connect(DATABASE) as con:
+    with book_connection(session.get('book_id')) as con:
         cur = con.cursor()
         # only delete if the transaction belongs to the selected book
         cur.execute("DELETE FROM transactions WHERE id = ? AND book_id = ?", (tx_id, session.get('book_id')))
@@ -381,6 +1778,196 @@ def delete_transaction(tx_id):
     return redirect(url_for('index'))
 
 
+def _bulk_where(book_id, ids):
+    """WHERE clause and params selecting `ids` (or all rows if None) within a book."""
+    if not book_exists(book_id):
+        raise ValueError('Book not found')
+    if ids is None:
+        return 'book_id = ?', [book_id]
+    # one JSON parameter instead of N placeholders keeps it a single statement at any size
+    return 'book_id = ? AND id IN (SELECT value FROM json_each(?))', [book_id, json.dumps([int(i) for i in ids])]
+
+
+def bulk_move(book_id, ids, target_book_id):
+    """Move transactions (all of the book's if `ids` is None) to another book; return the count.
+
+    In sharded mode the rows are copied into the target book's file and
+    deleted from the source file in one transaction spanning both (the
+    source is ATTACHed to the target's connection); they get new ids there.
+    """
+    where, params = _bulk_where(book_id, ids)
+    if not book_exists(target_book_id):
+        raise ValueError('Target book not found')
+    if target_book_id == book_id:
+        return 0
+    if not SHARD_DIR:
+        with sqlite.connect(DATABASE) as con:
+            cur = con.cursor()
+            cur.execute(f'UPDATE transactions SET book_id = ? WHERE {where}', [target_book_id] + params)
+            con.commit()
+            return cur.rowcount
+    if not os.path.exists(shard_path(book_id)):
+        return 0
+    with book_connection(target_book_id) as con:
+        cur = con.cursor()
+        cur.execute('ATTACH DATABASE ? AS source', (shard_path(book_id),))
+        try:
+            cur.execute(f'''INSERT INTO main.transactions (date, description, amount_cents, category, book_id)
+                            SELECT date, description, amount_cents, category, ? FROM source.transactions
+                            WHERE {where} ORDER BY id''', [target_book_id] + params)
+            cur.execute(f'DELETE FROM source.transactions WHERE {where}', params)
+            moved = cur.rowcount
+            con.commit()
+        except Exception:
+            con.rollback()  # DETACH is refused while the transaction is open
+            raise
+        finally:
+            cur.execute('DETACH DATABASE source')
+    return moved
+
+
+def bulk_recategorise(book_id, ids, category):
+    """Set the category of transactions (all of the book's if `ids` is None); return the count."""
+    if not category:
+        raise ValueError('Choose a category')
+    names, _ = get_categories()
+    if category not in names:
+        raise ValueError('Category not found')
+    where, params = _bulk_where(book_id, ids)
+    with book_connection(book_id) as con:
+        cur = con.cursor()
+        cur.execute(f'UPDATE transactions SET category = ? WHERE {where}', [category] + params)
+        con.commit()
+        return cur.rowcount
+
+
+def bulk_delete(book_id, ids):
+    """Delete transactions (all of the book's if `ids` is None); return the count."""
+    where, params = _bulk_where(book_id, ids)
+    with book_connection(book_id) as con:
+        cur = con.cursor()
+        cur.execute(f'DELETE FROM transactions WHERE {where}', params)
+        con.commit()
+        return cur.rowcount
+
+
+def merge_categories(source, target):
+    """Fold category `source` into `target` across all books and delete `source`.
+
+    Transactions, rules and recurring transactions are repointed with one UPDATE
+    each; a budget for `source` is kept only where the book has none for `target`.
+    In sharded mode each book file is updated in turn before the catalog, so an
+    interrupted merge can simply be run again. Returns the number of
+    transactions moved.
+    """
+    if not source or not target or source == target:
+        raise ValueError('Choose two different categories')
+    names, _ = get_categories()
+    if target not in names:
+        raise ValueError('Target category not found')
+    moved = 0
+    if SHARD_DIR:
+        for b in get_books()[1]:
+            if os.path.exists(shard_path(b['id'])):
+                with book_connection(b['id']) as con:
+                    cur = con.cursor()
+                    cur.execute('UPDATE main.transactions SET category = ? WHERE category = ?', (target, source))
+                    moved += cur.rowcount
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        cur.execute('UPDATE transactions SET category = ? WHERE category = ?', (target, source))
+        moved += cur.rowcount
+        cur.execute('UPDATE category_rules SET category = ? WHERE category = ?', (target, source))
+        cur.execute('UPDATE recurring_rules SET category = ? WHERE category = ?', (target, source))
+        cur.execute('UPDATE OR IGNORE budgets SET category = ? WHERE category = ?', (target, source))
+        cur.execute('DELETE FROM budgets WHERE category = ?', (source,))
+        cur.execute('DELETE FROM categories WHERE name = ?', (source,))
+        con.commit()
+    return moved
+
+
+@app.route('/bulk', methods=['POST'])
+def bulk_action():
+    """Apply a move/re-categorise/delete action to the transactions selected on the book page."""
+    r = ensure_book_selected()
+    if r:
+        return r
+    book_id = session.get('book_id')
+    ids = request.form.getlist('ids')
+    action = request.form.get('action', '')
+    if not ids:
+        flash('Select at least one transaction', 'error')
+        return redirect(url_for('view_book', book_id=book_id))
+    try:
+        if action == 'move':
+            count = bulk_move(book_id, ids, int(request.form.get('target_book_id') or 0))
+            flash(f'Moved {count} transaction(s)', 'success')
+        elif action == 'recategorise':
+            count = bulk_recategorise(book_id, ids, request.form.get('category', ''))
+            flash(f'Re-categorised {count} transaction(s)', 'success')
+        elif action == 'delete':
+            count = bulk_delete(book_id, ids)
+            flash(f'Deleted {count} transaction(s)', 'success')
+        else:
+            flash('Unknown bulk action', 'error')
+    except ValueError as e:
+        flash(str(e), 'error')
+    return redirect(url_for('view_book', book_id=book_id))
+
+
+def _api_bulk(handler):
+    """Run a bulk JSON API call, mapping bad input to a 400 response."""
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(handler(data))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=str(e) or 'Invalid request'), 400
+
+
+# JSON endpoints for scripts. Transactions are chosen by "book_id" plus either
+# "ids" (a list) or "all": true for every transaction in the book.
+def _api_ids(data):
+    if data.get('all') is True:
+        return None
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        raise ValueError('Pass "ids" (a list of transaction ids) or "all": true')
+    # bool is a subclass of int, and floats or strings would be coerced by int()
+    if not all(type(i) is int for i in ids):
+        raise ValueError('Transaction ids must be integers')
+    return ids
+
+
+@app.route('/api/transactions/move', methods=['POST'])
+def api_bulk_move():
+    return _api_bulk(lambda d: {'moved': bulk_move(int(d['book_id']), _api_ids(d), int(d['target_book_id']))})
+
+
+@app.route('/api/transactions/recategorise', methods=['POST'])
+def api_bulk_recategorise():
+    return _api_bulk(lambda d: {'updated': bulk_recategorise(int(d['book_id']), _api_ids(d), d['category'])})
+
+
+@app.route('/api/transactions/delete', methods=['POST'])
+def api_bulk_delete():
+    return _api_bulk(lambda d: {'deleted': bulk_delete(int(d['book_id']), _api_ids(d))})
+
+
+@app.route('/api/categories/merge', methods=['POST'])
+def api_merge_categories():
+    return _api_bulk(lambda d: {'moved': merge_categories(d['source'], d['target'])})
+
+
+@app.route('/categories/merge', methods=['POST'])
+def merge_categories_form():
+    try:
+        moved = merge_categories(request.form.get('source', ''), request.form.get('target', ''))
+        flash(f'Categories merged ({moved} transaction(s) moved)', 'success')
+    except ValueError as e:
+        flash(str(e), 'error')
+    return redirect(url_for('manage_categories'))
+
+
 @app.route('/edit/<int:tx_id>', methods=['GET', 'POST'])
 def edit_transaction(tx_id):
     # ensure a book is selected before editing
@@ -392,13 +1979,18 @@ def edit_transaction(tx_id):
         description = request.form.get('description', '')
         if not description or not description.strip():
             description = DEFAULT_DESCRIPTION
-        amount = float(request.form['amount'])
+        try:
+            amount_cents = to_cents(request.form['amount'])
+        except ValueError:
+            from flask import flash
+            flash('Amount must be a number', 'error')
+            return redirect(url_for('edit_transaction', tx_id=tx_id))
         category = request.form.get('category', '')
-        with sqlite.connect(DATABASE) as con:
+        with book_connection(session.get('book_id')) as con:
             cur = con.cursor()
             cur.execute(
-                "UPDATE transactions SET description = ?, amount = ?, category = ? WHERE id = ?",
-                (description, amount, category, tx_id),
+                "UPDATE transactions SET description = ?, amount_cents = ?, category = ? WHERE id = ?",
+                (description, amount_cents, category, tx_id),
             )
             con.commit()
         from flask import flash
@@ -406,13 +1998,77 @@ def edit_transaction(tx_id):
         return redirect(url_for('index'))
 
     # GET: load the existing record
-    with sqlite.connect(DATABASE) as con:
-        df = pd.read_sql_query("SELECT id, description, amount, category FROM transactions WHERE id = ? AND book_id = ?", con, params=(tx_id, session.get('book_id')))
+    with book_connection(session.get('book_id')) as con:
+        df = pd.read_sql_query("SELECT id, description, amount_cents, category FROM transactions WHERE id = ? AND book_id = ?", con, params=(tx_id, session.get('book_id')))
     if df.empty:
         return redirect(url_for('index'))
     row = df.to_dict(orient='records')[0]
     categories, _ = get_categories()
     return render_template('edit.html', row=row, categories=categories)
+@app.route('/recurring', methods=['GET', 'POST'])
+def manage_recurring():
+    """List and create recurring transactions for the current book."""
+    r = ensure_book_selected()
+    if r:
+        return r
+    if request.method == 'POST':
+        description = request.form.get('description', '').strip() or DEFAULT_DESCRIPTION
+        category = request.form.get('category', '') or 'Other'
+        frequency = request.form.get('frequency', '')
+        try:
+            amount_cents = to_cents(request.form.get('amount', ''))
+            interval = int(request.form.get('interval', '') or 1)
+            start = date.fromisoformat(request.form.get('start_date', '') or date.today().isoformat())
+            end_raw = request.form.get('end_date', '')
+            end = date.fromisoformat(end_raw) if end_raw else None
+        except ValueError:
+            flash('Amount, interval and dates must be valid', 'error')
+            return redirect(url_for('manage_recurring'))
+        if frequency not in RECURRING_FREQUENCIES:
+            flash('Repeat every day, week or month', 'error')
+            return redirect(url_for('manage_recurring'))
+        if amount_cents == 0 or interval < 1:
+            flash('Amount cannot be zero and interval must be at least 1', 'error')
+            return redirect(url_for('manage_recurring'))
+        with sqlite.connect(DATABASE) as con:
+            cur = con.cursor()
+            cur.execute(
+                '''INSERT INTO recurring_rules
+                   (book_id, description, amount_cents, category, frequency, interval, start_date, end_date, next_date)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (session.get('book_id'), description, amount_cents, category, frequency, interval,
+                 start.isoformat(), end.isoformat() if end else None, start.isoformat()),
+            )
+            con.commit()
+        added = materialise_recurring()
+        flash(f'Recurring transaction saved ({added} due occurrence(s) added)', 'success')
+        return redirect(url_for('manage_recurring'))
+
+    with sqlite.connect(DATABASE) as con:
+        df = pd.read_sql_query(
+            '''SELECT id, description, amount_cents, category, frequency, interval, start_date, end_date, next_date, occurrences
+               FROM recurring_rules WHERE book_id = ? ORDER BY next_date''',
+            con, params=(session.get('book_id'),)
+        )
+    categories, _ = get_categories()
+    return render_template('recurring.html', rows=df.to_dict(orient='records'), categories=categories,
+                           frequencies=RECURRING_FREQUENCIES, today=date.today().isoformat())
+
+
+@app.route('/recurring/delete/<int:rule_id>', methods=['POST'])
+def delete_recurring(rule_id):
+    r = ensure_book_selected()
+    if r:
+        return r
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        # already materialised transactions are kept; only future occurrences stop
+        cur.execute('DELETE FROM recurring_rules WHERE id = ? AND book_id = ?', (rule_id, session.get('book_id')))
+        con.commit()
+    flash('Recurring transaction deleted', 'success')
+    return redirect(url_for('manage_recurring'))
+
+
 @app.route('/report')
 def report():
     """Show comprehensive spending report with total and interactive pie chart by category."""
@@ -421,46 +2077,56 @@ def report():
     if r:
         return r
     book = find_current_book()
-    with sqlite.connect(DATABASE) as con:
+    # budgets show the current month, so a new month must change the ETag too
+    month = datetime.now().date().isoformat()[:7]
+    etag = make_etag('report', month, book_id=book['id'])
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    with book_connection(book['id']) as con:
         # Get category totals with transaction counts
         df = pd.read_sql_query(
-            """SELECT category, SUM(amount) as total, COUNT(*) as transaction_count, 
-               AVG(amount) as avg_amount FROM transactions 
+            """SELECT category, SUM(amount_cents) as total, COUNT(*) as transaction_count, 
+               AVG(amount_cents) as avg_amount FROM transactions 
                WHERE book_id = ? GROUP BY category ORDER BY total DESC""",
             con, params=(book['id'],)
         )
         # Get overall totals and stats
         total_result = pd.read_sql_query(
-            """SELECT SUM(amount) as grand_total, COUNT(*) as total_transactions,
-               AVG(amount) as overall_avg, MIN(amount) as min_amount, MAX(amount) as max_amount
+            """SELECT SUM(amount_cents) as grand_total, COUNT(*) as total_transactions,
+               AVG(amount_cents) as overall_avg, MIN(amount_cents) as min_amount, MAX(amount_cents) as max_amount
                FROM transactions WHERE book_id = ?""",
             con, params=(book['id'],)
         )
         # Get recent transactions for trend analysis
         recent_transactions = pd.read_sql_query(
-            """SELECT category, amount, date FROM transactions WHERE book_id = ?
+            """SELECT category, amount_cents, date FROM transactions WHERE book_id = ?
                ORDER BY date DESC LIMIT 10""",
             con, params=(book['id'],)
         )
     
-    # Extract stats with safe defaults
-    if total_result.empty or total_result['grand_total'].iloc[0] is None:
+    # Extract stats with safe defaults. Amounts are integer cents throughout and
+    # only become currency strings in the template (see the money filter).
+    if total_result.empty or pd.isna(total_result['grand_total'].iloc[0]):
         grand_total = 0
         total_transactions = 0
         overall_avg = 0
         min_amount = 0
         max_amount = 0
     else:
-        grand_total = total_result['grand_total'].iloc[0]
-        total_transactions = total_result['total_transactions'].iloc[0]
+        grand_total = int(total_result['grand_total'].iloc[0])
+        total_transactions = int(total_result['total_transactions'].iloc[0])
         overall_avg = total_result['overall_avg'].iloc[0]
-        min_amount = total_result['min_amount'].iloc[0]
-        max_amount = total_result['max_amount'].iloc[0]
+        min_amount = int(total_result['min_amount'].iloc[0])
+        max_amount = int(total_result['max_amount'].iloc[0])
     
+    budgets = get_budget_progress(book['id'], month)
+    categories, _ = get_categories()
+
     # If there's no data, render without chart
     if df.empty:
-        return render_template('report.html', chart_json=None, grand_total=grand_total, 
-                             book_name=book['name'], insights={})
+        return cacheable(make_response(render_template('report.html', chart_json=None, grand_total=grand_total, 
+                             book_name=book['name'], insights={}, budgets=budgets, categories=categories)), etag)
     
     # Calculate spending insights
     insights = {
@@ -487,22 +2153,21 @@ def report():
         }
     }
 
-    # Create interactive Plotly pie chart
+    # warm the image cache for the <noscript> fallback and the PDF export
+    for chart_type in CHART_TYPES:
+        request_chart(book['id'], chart_type)
+
+    # Create interactive Plotly pie chart (the chart is a display boundary, so
+    # cents are converted to currency units here)
+    symbol = CURRENCIES.get(book['currency'], '')
     labels = df['category'].fillna('Uncategorized').tolist()
-    values = df['total'].tolist()
-    
-    # Create custom hover text with amounts and percentages
-    hover_text = []
-    total_sum = sum(values)
-    for i, (label, value) in enumerate(zip(labels, values)):
-        percentage = (value / total_sum) * 100
-        hover_text.append(f"{label}<br>${value:.2f}<br>{percentage:.1f}% of total")
+    values = (df['total'] / 100).tolist()
     
     fig = go.Figure(data=[go.Pie(
         labels=labels,
         values=values,
         hovertemplate='<b>%{label}</b><br>' +
-                      'Amount: $%{value:.2f}<br>' +
+                      f'Amount: {symbol}%{{value:.2f}}<br>' +
                       'Percentage: %{percent}<br>' +
                       '<extra></extra>',
         textinfo='label+percent',
@@ -536,8 +2201,129 @@ def report():
     # Convert to JSON for embedding in template
     chart_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
     
-    return render_template('report.html', chart_json=chart_json, grand_total=grand_total, 
-                         book_name=book['name'], insights=insights)
+    return cacheable(make_response(render_template('report.html', chart_json=chart_json, grand_total=grand_total, 
+                         book_name=book['name'], insights=insights, budgets=budgets, categories=categories)), etag)
+
+
+@app.route('/chart/<int:book_id>/<chart_type>.<fmt>')
+def chart_image(book_id, chart_type, fmt):
+    """Serve a server-rendered chart image; `?size=small|medium|large` picks the size."""
+    size = request.args.get('size', 'medium')
+    if chart_type not in CHART_TYPES or fmt not in CHART_FORMATS or size not in CHART_SIZES:
+        return 'Not Found', 404
+    if book_id not in [b['id'] for b in get_books()[1]]:
+        return 'Not Found', 404
+    etag = make_etag('chart', chart_type, size, fmt, book_id=book_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    try:
+        path = get_chart(book_id, chart_type, size, fmt)
+    except FutureTimeoutError:
+        return 'Chart is still rendering', 503, {'Retry-After': '5'}
+    if path is None:
+        return 'Not Found', 404
+    return cacheable(send_file(os.path.abspath(path), mimetype=CHART_FORMATS[fmt], etag=False), etag)
+
+
+@app.route('/report/chart')
+def report_chart():
+    """Static image version of the report charts for browsers without JavaScript."""
+    r = ensure_book_selected()
+    if r:
+        return r
+    book = find_current_book()
+    etag = make_etag('report_chart', book_id=book['id'])
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    images, complete = {}, True
+    for chart_type in CHART_TYPES:
+        try:
+            path = get_chart(book['id'], chart_type)
+        except FutureTimeoutError:
+            return 'Chart is still rendering', 503, {'Retry-After': '5'}
+        except Exception:
+            # the page is shown without this chart and not cached, so the next request retries it
+            logger.exception('Rendering %s chart of book %s failed', chart_type, book['id'])
+            complete = False
+            continue
+        if path is not None:
+            with open(path, 'rb') as f:
+                images[chart_type] = base64.b64encode(f.read()).decode('ascii')
+    response = make_response(render_template('chart.html', plot_url=images.get('pie'),
+                                             trend_url=images.get('trend')))
+    if not complete:
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return cacheable(response, etag)
+
+
+@app.route('/budgets', methods=['POST'])
+def set_budget():
+    """Create or update the monthly budget for a category in the current book."""
+    r = ensure_book_selected()
+    if r:
+        return r
+    category = request.form.get('category', '').strip()
+    try:
+        limit_cents = to_cents(request.form.get('monthly_limit', ''))
+        alert_threshold = float(request.form.get('alert_threshold', '') or 80) / 100
+    except ValueError:
+        flash('Budget limit and threshold must be numbers', 'error')
+        return redirect(url_for('report'))
+    if not category or limit_cents <= 0 or not 0 < alert_threshold <= 1:
+        flash('Choose a category, a positive limit and a threshold between 1 and 100%', 'error')
+        return redirect(url_for('report'))
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        cur.execute(
+            '''INSERT INTO budgets (book_id, category, limit_cents, alert_threshold) VALUES (?, ?, ?, ?)
+               ON CONFLICT (book_id, category) DO UPDATE
+               SET limit_cents = excluded.limit_cents, alert_threshold = excluded.alert_threshold''',
+            (session.get('book_id'), category, limit_cents, alert_threshold),
+        )
+        con.commit()
+    flash('Budget saved', 'success')
+    return redirect(url_for('report'))
+
+
+@app.route('/budgets/delete/<int:budget_id>', methods=['POST'])
+def delete_budget(budget_id):
+    r = ensure_book_selected()
+    if r:
+        return r
+    with sqlite.connect(DATABASE) as con:
+        cur = con.cursor()
+        cur.execute('DELETE FROM budgets WHERE id = ? AND book_id = ?', (budget_id, session.get('book_id')))
+        con.commit()
+    flash('Budget deleted', 'success')
+    return redirect(url_for('report'))
+
+
+@app.route('/summary')
+def books_summary():
+    """Totals for every book, plus category totals per currency across books."""
+    _, books = get_books()
+    per_book = query_all_books(
+        '''SELECT book_id, COUNT(*) AS transaction_count, SUM(amount_cents) AS total_cents, MAX(date) AS last_date
+           FROM {transactions} GROUP BY book_id''')
+    per_category = query_all_books(
+        '''SELECT book_id, COALESCE(category, 'Uncategorized') AS category, SUM(amount_cents) AS total_cents
+           FROM {transactions} GROUP BY book_id, category''')
+    stats = per_book.set_index('book_id').to_dict(orient='index')
+    rows = []
+    for b in books:
+        st = stats.get(b['id'], {})
+        rows.append(dict(b, transaction_count=int(st.get('transaction_count', 0)),
+                         total_cents=int(st.get('total_cents', 0)), last_date=st.get('last_date')))
+    # amounts only add up within one currency, so books are grouped by theirs
+    per_category['currency'] = per_category['book_id'].map({b['id']: b['currency'] for b in books})
+    grouped = (per_category.dropna(subset=['currency'])
+               .groupby(['currency', 'category'], as_index=False)['total_cents'].sum()
+               .sort_values(['currency', 'total_cents'], ascending=[True, False]))
+    currencies = {currency: group.to_dict(orient='records') for currency, group in grouped.groupby('currency')}
+    return render_template('summary.html', rows=rows, by_currency=currencies)
 
 
 @app.route('/report/<int:book_id>')
@@ -574,10 +2360,15 @@ def export_book_csv(book_id):
         flash('Book not found', 'error')
         return redirect(url_for('index'))
     
+    etag = make_etag('export_csv', book_id=book_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
     # Get all transactions for this book with date information
-    with sqlite.connect(DATABASE) as con:
+    with book_connection(book_id) as con:
         df = pd.read_sql_query(
-            """SELECT date, description, amount, category 
+            """SELECT date, description, amount_cents, category 
                FROM transactions 
                WHERE book_id = ? 
                ORDER BY date DESC, id DESC""", 
@@ -588,7 +2379,8 @@ def export_book_csv(book_id):
         flash('No transactions found to export', 'warning')
         return redirect(url_for('view_book', book_id=book_id))
     
-    # Create CSV content
+    # Create CSV content with amounts as plain decimals
+    df.insert(2, 'amount', df.pop('amount_cents').map(format_amount))
     output = io.StringIO()
     df.to_csv(output, index=False)
     output.seek(0)
@@ -598,7 +2390,7 @@ def export_book_csv(book_id):
     response.headers['Content-Type'] = 'text/csv'
     response.headers['Content-Disposition'] = f'attachment; filename="{found["name"]}_transactions.csv"'
     
-    return response
+    return cacheable(response, etag)
 
 
 @app.route('/export/pdf/<int:book_id>')
@@ -615,11 +2407,16 @@ def export_report_pdf(book_id):
         flash('Book not found', 'error')
         return redirect(url_for('index'))
     
+    etag = make_etag('export_pdf', book_id=book_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
     # Get the same data as the report page
-    with sqlite.connect(DATABASE) as con:
+    with book_connection(book_id) as con:
         df = pd.read_sql_query(
-            """SELECT category, SUM(amount) as total, COUNT(*) as transaction_count, 
-                      AVG(amount) as avg_amount
+            """SELECT category, SUM(amount_cents) as total, COUNT(*) as transaction_count, 
+                      AVG(amount_cents) as avg_amount
                FROM transactions 
                WHERE book_id = ? 
                GROUP BY category 
@@ -630,10 +2427,10 @@ def export_report_pdf(book_id):
         # Get overall statistics
         stats_df = pd.read_sql_query(
             """SELECT COUNT(*) as total_transactions, 
-                      AVG(amount) as overall_avg,
-                      MIN(amount) as min_amount,
-                      MAX(amount) as max_amount,
-                      SUM(amount) as grand_total
+                      AVG(amount_cents) as overall_avg,
+                      MIN(amount_cents) as min_amount,
+                      MAX(amount_cents) as max_amount,
+                      SUM(amount_cents) as grand_total
                FROM transactions 
                WHERE book_id = ?""",
             con, params=(book_id,)
@@ -644,11 +2441,13 @@ def export_report_pdf(book_id):
         return redirect(url_for('view_book', book_id=book_id))
     
     # Extract statistics
-    grand_total = float(stats_df.iloc[0]['grand_total']) if not stats_df.empty else 0
+    # all amounts are integer cents; format_money turns them into text below
+    grand_total = int(stats_df.iloc[0]['grand_total']) if not stats_df.empty else 0
     total_transactions = int(stats_df.iloc[0]['total_transactions']) if not stats_df.empty else 0
     overall_avg = float(stats_df.iloc[0]['overall_avg']) if not stats_df.empty else 0
-    min_amount = float(stats_df.iloc[0]['min_amount']) if not stats_df.empty else 0
-    max_amount = float(stats_df.iloc[0]['max_amount']) if not stats_df.empty else 0
+    min_amount = int(stats_df.iloc[0]['min_amount']) if not stats_df.empty else 0
+    max_amount = int(stats_df.iloc[0]['max_amount']) if not stats_df.empty else 0
+    currency = found['currency']
     
     # Create temporary file for PDF
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
@@ -737,11 +2536,11 @@ def export_report_pdf(book_id):
         
         # Overall statistics
         story.append(Paragraph('<b>Overall Statistics</b>', heading2_style))
-        story.append(Paragraph(f'Total Spent: <b>${grand_total:.2f}</b>', stats_style))
+        story.append(Paragraph(f'Total Spent: <b>{format_money(grand_total, currency)}</b>', stats_style))
         story.append(Paragraph(f'Total Transactions: <b>{total_transactions}</b>', stats_style))
-        story.append(Paragraph(f'Average per Transaction: <b>${overall_avg:.2f}</b>', stats_style))
-        story.append(Paragraph(f'Smallest Transaction: <b>${min_amount:.2f}</b>', stats_style))
-        story.append(Paragraph(f'Largest Transaction: <b>${max_amount:.2f}</b>', stats_style))
+        story.append(Paragraph(f'Average per Transaction: <b>{format_money(overall_avg, currency)}</b>', stats_style))
+        story.append(Paragraph(f'Smallest Transaction: <b>{format_money(min_amount, currency)}</b>', stats_style))
+        story.append(Paragraph(f'Largest Transaction: <b>{format_money(max_amount, currency)}</b>', stats_style))
         story.append(Spacer(1, 20))
         
         # Category breakdown table
@@ -754,9 +2553,9 @@ def export_report_pdf(book_id):
             category_name = str(row['category']) if pd.notna(row['category']) else 'Uncategorized'
             table_data.append([
                 category_name,
-                f'${row["total"]:.2f}',
+                format_money(row['total'], currency),
                 str(int(row['transaction_count'])),
-                f'${row["avg_amount"]:.2f}',
+                format_money(row['avg_amount'], currency),
                 f'{percentage:.1f}%'
             ])
         
@@ -784,25 +2583,115 @@ def export_report_pdf(book_id):
         if not df.empty:
             story.append(Paragraph('<b>Spending Summary</b>', heading2_style))
             top_category = df.iloc[0]
-            summary_text = f"Top spending category: <b>{top_category['category']}</b> (${top_category['total']:.2f}, {(top_category['total']/grand_total*100):.1f}% of total)"
+            summary_text = f"Top spending category: <b>{top_category['category']}</b> ({format_money(top_category['total'], currency)}, {(top_category['total']/grand_total*100):.1f}% of total)"
             story.append(Paragraph(summary_text, normal_style))
+
+        # Charts come from the shared image cache; a slow or failed render
+        # leaves them out rather than failing the export, and such a PDF gets
+        # no ETag so it is not reused once the charts can be drawn
+        complete = True
+        try:
+            chart_paths = [get_chart(book_id, chart_type) for chart_type in CHART_TYPES]
+        except Exception:
+            logger.exception('Rendering charts for PDF export of book %s failed', book_id)
+            chart_paths, complete = [], False
+        chart_paths = [p for p in chart_paths if p]
+        if chart_paths:
+            story.append(Spacer(1, 20))
+            story.append(Paragraph('<b>Charts</b>', heading2_style))
+            width, height = CHART_SIZES['medium']
+            for path in chart_paths:
+                story.append(Image(path, width=6 * inch, height=6 * inch * height / width))
+                story.append(Spacer(1, 12))
         
         # Build PDF
         doc.build(story)
         
         # Send the file
-        return send_file(
+        response = send_file(
             temp_file.name,
             as_attachment=True,
             download_name=f'{found["name"]}_report.pdf',
-            mimetype='application/pdf'
+            mimetype='application/pdf',
+            etag=False
         )
+        if not complete:
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        return cacheable(response, etag)
         
     finally:
         # Clean up temp file after a delay (Flask handles this)
         pass
 
 
+@app.route('/backups', methods=['GET', 'POST'])
+def manage_backups():
+    """List database backups and create a new one on POST."""
+    if request.method == 'POST':
+        path = backup_database(compress=bool(request.form.get('compress')))
+        removed = rotate_backups()
+        flash(f'Backup created: {os.path.basename(path)}' + (f' ({removed} old backup(s) removed)' if removed else ''), 'success')
+        return redirect(url_for('manage_backups'))
+    return render_template('backups.html', rows=list_backups(), retention=BACKUP_RETENTION)
+
+
+@app.route('/backups/download/<name>')
+def download_backup(name):
+    path = safe_join(BACKUP_DIR, name)
+    if path is None or not os.path.isfile(path):
+        flash('Backup not found', 'error')
+        return redirect(url_for('manage_backups'))
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=name)
+
+
+@app.route('/backups/restore/<name>', methods=['POST'])
+def restore_backup(name):
+    path = safe_join(BACKUP_DIR, name)
+    if path is None or not os.path.isfile(path):
+        flash('Backup not found', 'error')
+        return redirect(url_for('manage_backups'))
+    try:
+        restore_database(path)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('manage_backups'))
+    # the selected book may not exist in the restored data
+    session.pop('book_id', None)
+    flash(f'Restored {name}', 'success')
+    return redirect(url_for('manage_backups'))
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Personal accounting web app')
+    parser.add_argument('--shard-dir', default=SHARD_DIR,
+                        help="keep each book's transactions in its own database file in this directory")
+    parser.add_argument('--group-commit', action='store_true', default=GROUP_COMMIT,
+                        help='batch concurrent new transactions into shared commits')
+    commands = parser.add_subparsers(dest='command')
+    backup_cmd = commands.add_parser('backup', help='write an online backup of the database')
+    backup_cmd.add_argument('--compress', action='store_true', help='gzip the backup')
+    backup_cmd.add_argument('--keep', type=int, default=BACKUP_RETENTION, help='number of backups to keep')
+    restore_cmd = commands.add_parser('restore', help='restore the database from a backup file')
+    restore_cmd.add_argument('path')
+    args = parser.parse_args()
+
+    SHARD_DIR = args.shard_dir
+    GROUP_COMMIT = args.group_commit
     init_db()
-    app.run(debug=True)
\ No newline at end of file
+    if args.command == 'backup':
+        print(backup_database(compress=args.compress))
+        rotate_backups(keep=args.keep)
+    elif args.command == 'restore':
+        try:
+            restore_database(args.path)
+        except ValueError as e:
+            sys.exit(f'Restore failed: {e}')
+        print(f'Restored {args.path}')
+    else:
+        if build_assets.ensure_built():
+            _asset_manifest = load_asset_manifest()
+            _deploy_token = compute_deploy_token()
+        start_recurring_scheduler()
+        start_backup_scheduler()
+        app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""Tests for integer-cents money handling: parsing, formatting and exact sums.
+
+    python -m pytest test_money.py
+"""
+
+import sqlite3
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from main import MAX_AMOUNT_CENTS, format_amount, format_money, to_cents
+
+
+@pytest.mark.parametrize('raw, cents', [
+    ('12.3', 1230),
+    ('12.30', 1230),
+    (' 7 ', 700),
+    ('-0.01', -1),
+    ('0', 0),
+    (12.3, 1230),
+    (5, 500),
+    ('1e3', 100000),
+])
+def test_to_cents_parses(raw, cents):
+    assert to_cents(raw) == cents
+
+
+@pytest.mark.parametrize('raw, cents', [
+    ('0.005', 1),
+    ('0.004', 0),
+    ('-0.005', -1),
+    ('1.005', 101),
+    ('2.675', 268),
+    ('-2.675', -268),
+    ('0.0049999', 0),
+])
+def test_to_cents_rounds_half_up(raw, cents):
+    assert to_cents(raw) == cents
+
+
+def test_max_amount_is_accepted():
+    limit = format_amount(MAX_AMOUNT_CENTS)
+    assert to_cents(limit) == MAX_AMOUNT_CENTS
+    assert to_cents('-' + limit) == -MAX_AMOUNT_CENTS
+
+
+@pytest.mark.parametrize('raw', [
+    '', 'abc', '12,30', 'nan', 'NaN', '-nan', 'snan', 'inf', '-Infinity',
+    float('nan'), float('inf'),
+    '1e30', '-1e30', '1e999999999', '1000000000.01', 10 ** 12,
+])
+def test_to_cents_rejects(raw):
+    with pytest.raises(ValueError):
+        to_cents(raw)
+
+
+@pytest.mark.parametrize('cents, text', [
+    (0, '0.00'),
+    (1, '0.01'),
+    (-1, '-0.01'),
+    (1230, '12.30'),
+    (-123456, '-1234.56'),
+    (12.5, '0.13'),
+    (-12.5, '-0.13'),
+])
+def test_format_amount(cents, text):
+    assert format_amount(cents) == text
+
+
+def test_format_money():
+    assert format_money(1230) == '$12.30'
+    assert format_money(5, 'EUR') == '€0.05'
+
+
+def test_round_trip():
+    rng = np.random.default_rng(7)
+    for cents in rng.integers(-MAX_AMOUNT_CENTS, MAX_AMOUNT_CENTS, size=2000).tolist():
+        assert to_cents(format_amount(cents)) == cents
+
+
+def test_integer_sums_are_exact():
+    """A million random amounts sum exactly in SQLite and NumPy int64."""
+    rng = np.random.default_rng(11)
+    cents = rng.integers(-500_000, 5_000_000, size=1_000_000)
+    # the strings are built vectorised; each one still goes through to_cents
+    magnitude = np.abs(cents)
+    texts = np.char.add(np.char.add(np.where(cents < 0, '-', ''), (magnitude // 100).astype(str)),
+                        np.char.add('.', np.char.zfill((magnitude % 100).astype(str), 2)))
+    parsed = np.fromiter((to_cents(t) for t in texts.tolist()), dtype=np.int64, count=len(texts))
+    assert np.array_equal(parsed, cents)
+    exact = Decimal(sum(cents.tolist())) / 100
+
+    con = sqlite3.connect(':memory:')
+    con.execute('CREATE TABLE t (amount_cents INTEGER)')
+    con.executemany('INSERT INTO t VALUES (?)', ((c,) for c in parsed.tolist()))
+    sql_sum = con.execute('SELECT SUM(amount_cents) FROM t').fetchone()[0]
+
+    assert Decimal(int(parsed.sum())) / 100 == exact
+    assert Decimal(sql_sum) / 100 == exact
+
+
+def test_sum_of_max_amounts_fits_int64():
+    con = sqlite3.connect(':memory:')
+    con.execute('CREATE TABLE t (amount_cents INTEGER)')
+    con.executemany('INSERT INTO t VALUES (?)', [(MAX_AMOUNT_CENTS,)] * 10_000)
+    assert con.execute('SELECT SUM(amount_cents) FROM t').fetchone()[0] == MAX_AMOUNT_CENTS * 10_000